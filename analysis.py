@@ -0,0 +1,126 @@
+"""
+Batch analysis of positions.
+
+Positions are given in the notation of Game.to_notation, one per line, and
+each is searched to a fixed depth in a pool of worker processes. Results
+come back in input order as dicts (or lines of NDJSON from the command
+line), as soon as each chunk of positions is done:
+
+    python analysis.py --depth 6 < positions.txt > results.ndjson
+
+Each result holds the position, the score from White's point of view and
+the best move as minimax returns them, the nodes searched, and, when the
+tablebase covers the position, its exact result and distance. A position
+that cannot be read gives a result with an "error" instead.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from main import TABLEBASE_PATH, Game
+
+WORKERS = int(os.environ.get("MORRIS_WORKERS", os.cpu_count() or 1))
+# Positions per task sent to a worker
+CHUNK_SIZE = 32
+RESULTS = {1: "win", 0: "draw", -1: "loss"}
+
+# The game of the current process, reused for every position it analyses at one depth
+_game = None
+
+
+def tt_size(depth):
+    """
+    Transposition table slots for a search to depth: a few per node it
+    visits (the branching factor is about 3), from 256 up to the default
+    65536, so that clearing the table does not dominate shallow searches
+    """
+    return 1 << min(16, max(8, 2 * depth))
+
+
+def analyze_position(notation, depth):
+    """Search one position to depth and return its result dict"""
+    global _game
+    notation = notation.strip()
+    try:
+        position = Game.from_notation(notation, tt_size=0)
+    except ValueError as error:
+        return {"position": notation, "error": str(error)}
+    size = tt_size(depth)
+    if _game is None or _game.tt.size != size:
+        _game = Game(tt_size=size)
+    game = _game
+    # A fresh start empties the transposition table and move ordering history, so results
+    # do not depend on what was analysed before
+    game.start()
+    game.restore(position.snapshot())
+    game.nodes = 0
+    score, best_move = game.minimax(depth, -math.inf, math.inf, game.player == 'W')
+    result = {"position": notation, "score": score, "best_move": best_move, "depth": depth,
+              "nodes": game.nodes}
+    solution = game.solution()
+    if solution is not None:
+        result["result"] = RESULTS[solution[0]]
+        result["distance"] = solution[1]
+    return result
+
+
+def analyze_chunk(positions, depth):
+    """analyze_position for each of a list of positions"""
+    return [analyze_position(notation, depth) for notation in positions]
+
+
+def chunks(positions, size=CHUNK_SIZE):
+    """Split an iterable of positions into lists of size, skipping blank lines"""
+    chunk = []
+    for notation in positions:
+        if notation.strip():
+            chunk.append(notation)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(tablebase_path):
+    if os.path.exists(tablebase_path):
+        Game.load_tablebase(tablebase_path)
+
+
+def analyze(positions, depth, workers=WORKERS, chunk_size=CHUNK_SIZE):
+    """Yield the result of every position, in order, searching them in workers processes"""
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(TABLEBASE_PATH,)) as executor:
+        # Unlike map, which would read all the input first, keep only a few chunks in flight
+        pending = []
+        for chunk in chunks(positions, chunk_size):
+            pending.append(executor.submit(analyze_chunk, chunk, depth))
+            if len(pending) >= 2 * workers:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search many positions, one per line of input, "
+                                                 "and write a line of JSON for each")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("input", nargs="?", help="file of positions (default: standard input)")
+    args = parser.parse_args()
+
+    source = open(args.input) if args.input else sys.stdin
+    start = time.perf_counter()
+    count = 0
+    with source:
+        for result in analyze(source, args.depth, args.workers):
+            print(json.dumps(result))
+            count += 1
+    print(f"Analysed {count} positions in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
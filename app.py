@@ -1,9 +1,122 @@
-from fastapi import FastAPI, Query
-from fastapi.responses import FileResponse
-from main import Game
-
-app = FastAPI()
-game = Game()
+import asyncio
+import json
+import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import (Depends, FastAPI, Header, HTTPException, Query, Request, Response, WebSocket,
+                     WebSocketDisconnect)
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from main import MAX_SEARCH_DEPTH, TABLEBASE_PATH, Game, encode_points, unpack_position
+import analysis
+import cache
+import jobs
+import metrics
+import profiles
+import sessions
+import workers
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    pool.shutdown()
+    results.close()
+
+
+app = FastAPI(lifespan=lifespan)
+pool = workers.SearchPool()
+if os.path.exists(TABLEBASE_PATH):
+    Game.load_tablebase(TABLEBASE_PATH)
+games = sessions.SessionStore()
+# Message queues of the WebSocket clients watching each game
+watchers = {}
+searches = jobs.JobStore()
+# Results of fixed-depth searches, shared by every game
+results = cache.SearchCache()
+# Counters of every search answered, for /metrics
+counters = metrics.SearchMetrics()
+# cProfile statistics of the searches profiled, for the admin endpoints
+traces = profiles.ProfileStore()
+# Query parameters of the computer's searches: a depth of at least one ply (up to the
+# deepest iterative deepening goes) and a time budget in milliseconds
+SEARCH_DEPTH = Query(None, ge=1, le=MAX_SEARCH_DEPTH)
+TIME_BUDGET = Query(None, ge=0)
+# Searches a job can run
+SEARCHES = {"computer_move": workers.computer_move,
+            "remove_best_opponent_piece": workers.remove_best_opponent_piece}
+
+
+def current_game(game_id: str):
+    # Every endpoint below /start names its game with the game_id query parameter
+    game = games.get(game_id)
+    if game is None:
+        raise HTTPException(status_code=404, detail="unknown or expired game_id")
+    return game
+
+
+def state_tag(game):
+    # The version of a game's state, an ETag that changes whenever anything in /state does
+    white, black, player, placed, white_count, black_count, removed_white, removed_black = game.snapshot()
+    return (f'"{white:04x}{black:04x}{player}{placed}-{white_count}{black_count}'
+            f'{removed_white}{removed_black}{int(game.game_active)}"')
+
+
+def game_state(game, **extra):
+    # The /state snapshot that the mutating endpoints answer with, plus their own results
+    return {**game.state(), "version": state_tag(game), **extra}
+
+
+def publish(game, message):
+    for queue in watchers.get(game, ()):
+        queue.put_nowait(message)
+
+
+def updated(game, **extra):
+    # game_state for the endpoints that change the game, which also goes to its watchers
+    state = game_state(game)
+    publish(game, {"type": "state", "state": state})
+    return {**state, **extra}
+
+
+@app.websocket("/ws")
+async def watch(websocket: WebSocket, game_id: str):
+    # Pushes the game's state, then what changes in it after every move, and search progress
+    game = games.get(game_id)
+    if game is None:
+        await websocket.close(code=4404, reason="unknown or expired game_id")
+        return
+    await websocket.accept()
+    queue = asyncio.Queue()
+    watchers.setdefault(game, set()).add(queue)
+
+    async def send():
+        last = game_state(game)
+        await websocket.send_json({"type": "state", "state": last})
+        while True:
+            message = await queue.get()
+            if message["type"] == "state":
+                state = message["state"]
+                changes = {key: value for key, value in state.items() if last.get(key) != value}
+                last = state
+                if changes:
+                    await websocket.send_json({"type": "diff", "changes": changes})
+            else:
+                await websocket.send_json(message)
+
+    sender = asyncio.create_task(send())
+    try:
+        # Nothing is expected from the client; this waits for it to go away
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        watchers[game].discard(queue)
+        if not watchers[game]:
+            del watchers[game]
 
 
 @app.get("/")
@@ -22,129 +135,418 @@ async def get_script():
 
 
 @app.post("/start")
-async def start():
+async def start(game_id: Optional[str] = None, notation: Optional[str] = None):
+    # Restart the given game, or create one if there is none (or it expired),
+    # from the start or from the position in notation
+    position = None
+    if notation is not None:
+        try:
+            position = Game.from_notation(notation, tt_size=0)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+    game = games.get(game_id) if game_id else None
+    if game is None:
+        game_id, game = games.create()
     game.start()
+    if position is not None:
+        game.restore(position.snapshot())
+    return updated(game, game_id=game_id)
+
+
+@app.get("/position")
+async def position(format: str = "text", game: Game = Depends(current_game)):
+    # The position in Game.to_notation's form, or as the 5 bytes of Game.to_packed
+    if format == "binary":
+        return Response(game.to_packed(), media_type="application/octet-stream")
+    if format != "text":
+        raise HTTPException(status_code=400, detail="format must be text or binary")
+    return game.to_notation()
+
+
+@app.get("/state")
+async def state(response: Response, game: Game = Depends(current_game),
+                if_none_match: Optional[str] = Header(None)):
+    # Board, counts, legal moves and winner in one response; 304 if the client's copy is current
+    tag = state_tag(game)
+    if if_none_match == tag:
+        return Response(status_code=304, headers={"ETag": tag})
+    response.headers["ETag"] = tag
+    return game_state(game)
 
 
 @app.post("/switch")
-async def switch():
+async def switch(game: Game = Depends(current_game)):
     game.switch()
+    return updated(game)
 
 
 @app.post("/place")
-async def place(x: int, y: int):
+async def place(x: int, y: int, game: Game = Depends(current_game)):
     success = game.place(x, y)
+    mill = success and game.check_mill(x, y, game.player)
     if success:
         # Check for mill formation
-        if game.check_mill(x, y, game.player):
+        if mill:
             # Don't switch player yet - let the frontend handle mill removal
             pass
         else:
             # No mill formed, switch player
             game.switch()
-    return success
+    return updated(game, success=success, mill=mill)
 
 
 @app.post("/move")
-async def move(x: int, y: int, nx: int, ny: int):
+async def move(x: int, y: int, nx: int, ny: int, game: Game = Depends(current_game)):
     success = game.move(x, y, nx, ny)
+    mill = success and game.check_mill(nx, ny, game.player)
     if success:
         # Check for mill formation
-        if game.check_mill(nx, ny, game.player):
+        if mill:
             # Don't switch player yet - let the frontend handle mill removal
             pass
         else:
             # No mill formed, switch player
             game.switch()
-    return success
+    return updated(game, success=success, mill=mill)
 
 
 @app.get("/get_piece_count")
-async def get_piece_count(player: str):
+async def get_piece_count(player: str, game: Game = Depends(current_game)):
     return game.get_piece_count(player)
 
 
 @app.get("/check_mill")
-async def check_mill(x: int, y: int, player: str):
+async def check_mill(x: int, y: int, player: str, game: Game = Depends(current_game)):
     return game.check_mill(x, y, player)
 
 
 @app.get("/get_opponent_pieces")
-async def get_opponent_pieces(player: str):
+async def get_opponent_pieces(player: str, game: Game = Depends(current_game)):
     return game.get_opponent_pieces(player)
 
 
 @app.post("/remove_piece")
-async def remove_piece(x: int, y: int, player: str):
+async def remove_piece(x: int, y: int, player: str, game: Game = Depends(current_game)):
     success = game.remove_piece(x, y, player)
     if success:
         # Switch to the opponent (the one who lost their piece)
         game.switch()
-    return success
+    return updated(game, success=success)
 
 
 @app.get("/check_win")
-async def check_win():
+async def check_win(game: Game = Depends(current_game)):
     return game.check_win()
 
 
 @app.get("/has_valid_moves")
-async def has_valid_moves(player: str):
+async def has_valid_moves(player: str, game: Game = Depends(current_game)):
     return game.has_valid_moves(player)
 
 
 @app.post("/undo")
-async def undo():
-    game.undo()
+async def undo(game: Game = Depends(current_game)):
+    return updated(game, success=game.undo())
+
+
+@app.post("/redo")
+async def redo(game: Game = Depends(current_game)):
+    return updated(game, success=game.redo())
 
 
 @app.get("/get_unblocked_two_in_a_rows")
-async def get_unblocked_two_in_a_rows(player: str):
+async def get_unblocked_two_in_a_rows(player: str, game: Game = Depends(current_game)):
     return game.get_unblocked_two_in_a_rows(player)
 
 
 @app.get("/evaluate")
-async def evaluate():
+async def evaluate(game: Game = Depends(current_game)):
     return game.evaluate()
 
 
+async def search(game, function, *args, progress=None, cancel=None, profile=False):
+    # Searches run in the worker pool so other requests are served meanwhile. Returns the
+    # search's result and, if it was profiled, its profiles.Profile (or None)
+    notation = game.to_notation()
+    try:
+        result = await pool.run(function, game.snapshot(), *args, progress=progress, cancel=cancel,
+                                profile=profile)
+    except workers.PoolBusy:
+        raise HTTPException(status_code=503, detail="too many searches in progress, try again shortly",
+                            headers={"Retry-After": "1"})
+    if not profile:
+        return result, None
+    result, data = result
+    return result, traces.add(function.__name__, data, position=notation, args=list(args))
+
+
+async def search_and_play(game, function, depth, time_ms, cancel=None, profile=False):
+    # Apply the move found for a snapshot, unless the game moved on in the meantime
+    state = game.snapshot()
+    # Fixed-depth searches run fresh, from an empty transposition table, so their move depends
+    # only on the position and can be answered from the cache, unless the search is to be profiled
+    profile = traces.wanted(profile)
+    key = results.key(game, function.__name__, depth) if time_ms is None else None
+    found = results.get_played(key) if key is not None and not profile else None
+    if found is not None:
+        depth, history = found
+        for entry in history:
+            game.history.push(entry)
+            game.apply(entry)
+        counters.record(function.__name__, cached=True)
+        return updated(game, depth=depth, cached=True, stats=None)
+
+    def progress(depth, nodes, best_move):
+        publish(game, {"type": "progress", "depth": depth, "nodes": nodes, "best_move": best_move})
+
+    (depth, after, history, stats), trace = await search(game, function, depth, time_ms, key is not None,
+                                                         progress=progress if game in watchers else None,
+                                                         cancel=cancel, profile=profile)
+    counters.record(function.__name__, stats)
+    if game.snapshot() != state:
+        raise HTTPException(status_code=409, detail="the game changed during the search")
+    game.restore(after)
+    game.history.extend(history)
+    # A cancelled search stopped short of its depth
+    if key is not None and not (cancel is not None and cancel.is_set()):
+        results.put_played(key, depth, history)
+    if trace is not None:
+        return updated(game, depth=depth, cached=False, stats=stats, profile_id=trace.id)
+    return updated(game, depth=depth, cached=False, stats=stats)
+
+
 @app.get("/minimax")
-async def minimax(depth: int, alpha: int, beta: int, maximizing_player: bool):
-    return game.minimax(depth, alpha, beta, maximizing_player)
+async def minimax(response: Response, alpha: int, beta: int, maximizing_player: bool,
+                  depth: int = Query(..., ge=0, le=MAX_SEARCH_DEPTH),
+                  stats: bool = False, profile: bool = False, game: Game = Depends(current_game)):
+    # [score, best_move], or with stats an object that also holds the search's statistics
+    profile = traces.wanted(profile)
+    key = results.key(game, "minimax_white" if maximizing_player else "minimax_black", depth)
+    found = results.get_minimax(key, alpha, beta) if not profile else None
+    trace = None
+    if found is not None:
+        counters.record("minimax", cached=True)
+        score, best_move = found
+        search_stats = None
+    else:
+        (score, best_move, search_stats), trace = await search(game, workers.minimax, depth, alpha, beta,
+                                                               maximizing_player, True, profile=profile)
+        counters.record("minimax", search_stats)
+        results.put_minimax(key, alpha, beta, score, best_move)
+    if trace is not None:
+        response.headers["X-Profile-Id"] = trace.id
+    if stats:
+        answer = {"score": score, "best_move": best_move, "cached": found is not None, "stats": search_stats}
+        if trace is not None:
+            answer["profile_id"] = trace.id
+        return answer
+    return score, best_move
+
+
+@app.get("/cache")
+async def cache_stats():
+    # Size and hit rate of the search result cache
+    return results.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Search counters in the Prometheus text format
+    return PlainTextResponse(counters.render(), media_type="text/plain; version=0.0.4")
+
+
+def admin(x_admin_token: Optional[str] = Header(None)):
+    # The admin endpoints are off unless MORRIS_ADMIN_TOKEN is set, and then need it in X-Admin-Token
+    if profiles.ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="admin endpoints are disabled: set MORRIS_ADMIN_TOKEN")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, profiles.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="wrong or missing X-Admin-Token")
+
+
+@app.get("/admin/profiles", dependencies=[Depends(admin)])
+async def list_profiles():
+    # The profiles kept, newest first
+    return [profile.to_dict() for profile in traces]
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(admin)])
+async def get_profile(profile_id: str, format: str = "pstats", sort: str = "cumulative", limit: int = 40):
+    # The profile as a file for pstats, or with format=text its report of the limit slowest functions
+    profile = traces.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="unknown or expired profile_id")
+    if format == "text":
+        if sort not in profiles.SORT_KEYS:
+            raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(profiles.SORT_KEYS)}")
+        return PlainTextResponse(profile.report(sort, limit))
+    if format != "pstats":
+        raise HTTPException(status_code=400, detail="format must be pstats or text")
+    return Response(profile.data, media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{profile.filename()}"'})
+
+
+async def search_while_connected(request, game, function, depth, time_ms, profile=False):
+    # search_and_play, cut short if the client goes away
+    if depth is None and time_ms is None:
+        raise HTTPException(status_code=400, detail="depth or time_ms is required")
+    cancel = asyncio.Event()
+
+    async def watch():
+        while not await request.is_disconnected():
+            await asyncio.sleep(0.25)
+        cancel.set()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        return await search_and_play(game, function, depth, time_ms, cancel=cancel, profile=profile)
+    finally:
+        watcher.cancel()
 
 
 @app.post("/computer_move")
-async def computer_move(depth: int):
-    game.computer_move(depth)
+async def computer_move(request: Request, depth: Optional[int] = SEARCH_DEPTH,
+                        time_ms: Optional[int] = TIME_BUDGET, profile: bool = False, game: Game = Depends(current_game)):
+    # With time_ms the search deepens until the budget runs out (depth, if given, caps it)
+    return await search_while_connected(request, game, workers.computer_move, depth, time_ms, profile)
 
 
 @app.post("/remove_best_opponent_piece")
-async def remove_best_opponent_piece(depth: int):
-    game.remove_best_opponent_piece(depth)
+async def remove_best_opponent_piece(request: Request, depth: Optional[int] = SEARCH_DEPTH,
+                                     time_ms: Optional[int] = TIME_BUDGET, profile: bool = False, game: Game = Depends(current_game)):
+    return await search_while_connected(request, game, workers.remove_best_opponent_piece, depth, time_ms,
+                                        profile)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(game_id: str, search: str = "computer_move", depth: Optional[int] = SEARCH_DEPTH,
+                     time_ms: Optional[int] = TIME_BUDGET, profile: bool = False, game: Game = Depends(current_game)):
+    # Start a search in the background and answer at once with the job to poll, wait for or cancel
+    if search not in SEARCHES:
+        raise HTTPException(status_code=400, detail=f"search must be one of {', '.join(SEARCHES)}")
+    if depth is None and time_ms is None:
+        raise HTTPException(status_code=400, detail="depth or time_ms is required")
+    if searches.running(game_id):
+        raise HTTPException(status_code=409, detail="a search is already running for this game")
+    if pool.full():
+        raise HTTPException(status_code=503, detail="too many searches in progress, try again shortly",
+                            headers={"Retry-After": "1"})
+    job = searches.submit(game_id, lambda cancel: search_and_play(game, SEARCHES[search], depth, time_ms,
+                                                                  cancel=cancel, profile=profile))
+    return job.to_dict()
+
+
+def current_job(job_id: str):
+    job = searches.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job_id")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(wait: float = 0, job: jobs.Job = Depends(current_job)):
+    # With wait, hold the answer up to that many seconds for the job to finish
+    if wait > 0:
+        await job.wait(wait)
+    return job.to_dict()
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job: jobs.Job = Depends(current_job)):
+    # Stop the search; it plays the best move of its last completed depth, which is returned
+    job.cancel.set()
+    await job.wait()
+    return job.to_dict()
+
+
+@app.post("/analyze")
+async def analyze(request: Request, depth: int = Query(4, ge=0, le=MAX_SEARCH_DEPTH)):
+    # Positions in the body, one per line in Game.to_notation's form (or packed, 5 bytes
+    # each, with Content-Type application/octet-stream); a line of JSON comes back for
+    # each, in the same order, as the worker pool gets through them
+    body = await request.body()
+    if request.headers.get("content-type") == "application/octet-stream":
+        if len(body) % 5:
+            raise HTTPException(status_code=400, detail="packed positions are 5 bytes each")
+        positions = []
+        for i in range(0, len(body), 5):
+            white, black, player, placed = unpack_position(body[i:i + 5])
+            positions.append(f"{encode_points(white, black)} {player} {placed}")
+    else:
+        try:
+            positions = body.decode().splitlines()
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="positions must be UTF-8 text, one per line")
+    if pool.full():
+        raise HTTPException(status_code=503, detail="too many searches in progress, try again shortly",
+                            headers={"Retry-After": "1"})
+
+    async def run(chunk):
+        # Once the response has started there is no turning away, so wait for room instead
+        while True:
+            try:
+                return await pool.run(workers.analyze, chunk, depth)
+            except workers.PoolBusy:
+                await asyncio.sleep(0.1)
+
+    async def lines():
+        pending = []
+        try:
+            for chunk in analysis.chunks(positions):
+                pending.append(asyncio.ensure_future(run(chunk)))
+                if len(pending) > pool.workers:
+                    for result in await pending.pop(0):
+                        yield json.dumps(result) + "\n"
+            while pending:
+                for result in await pending.pop(0):
+                    yield json.dumps(result) + "\n"
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/position_value")
+async def position_value(game: Game = Depends(current_game)):
+    # Looked up in the solved database, no search
+    solution = game.solution()
+    if solution is None:
+        raise HTTPException(status_code=404, detail="position is not in the solved database")
+    outcome, distance, _ = solution
+    return {"player": game.player, "result": analysis.RESULTS[outcome], "distance": distance}
+
+
+@app.get("/best_move")
+async def best_move(game: Game = Depends(current_game)):
+    solution = game.solution()
+    if solution is None:
+        raise HTTPException(status_code=404, detail="position is not in the solved database")
+    outcome, distance, move = solution
+    return {"move": move, "result": analysis.RESULTS[outcome], "distance": distance}
 
 
 @app.get("/get_board")
-async def get_board():
+async def get_board(game: Game = Depends(current_game)):
     return game.board
 
 
 @app.get("/get_current_player")
-async def get_current_player():
+async def get_current_player(game: Game = Depends(current_game)):
     return game.player
 
 
 @app.get("/get_placed_count")
-async def get_placed_count():
+async def get_placed_count(game: Game = Depends(current_game)):
     return game.placed
 
 
 @app.get("/get_game_active")
-async def get_game_active():
+async def get_game_active(game: Game = Depends(current_game)):
     return game.game_active
 
 
 @app.get("/get_removed_count")
-async def get_removed_count(player: str):
+async def get_removed_count(player: str, game: Game = Depends(current_game)):
     if player == 'W':
         return game.removed_white
     else:
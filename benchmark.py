@@ -0,0 +1,266 @@
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+from main import MOVE_ORDERING, Game
+from parallel import ParallelSearch
+
+
+# Fixed movement-phase position: white to move, five pieces each, no mills.
+MIDGAME = (
+    [(0, 0), (2, 1), (4, 2), (1, 3), (2, 4)],
+    [(4, 0), (1, 1), (0, 2), (3, 3), (0, 4)],
+)
+
+
+def midgame(ordering=None):
+    """Build the benchmark position"""
+    game = Game(ordering=ordering)
+    game.start()
+    board = [['*' for j in range(5)] for i in range(5)]
+    for player, points in zip('WB', MIDGAME):
+        for x, y in points:
+            board[y][x] = player
+    game.board = board
+    game.white = len(MIDGAME[0])
+    game.black = len(MIDGAME[1])
+    game.placed = 12
+    return game
+
+
+def bench_minimax(depth, repeat, ordering=None):
+    """Run minimax on the benchmark position and return (game, seconds) of the fastest run"""
+    best = None
+    for _ in range(repeat):
+        game = midgame(ordering)
+        start = time.perf_counter()
+        game.minimax(depth, -math.inf, math.inf, game.player == 'W')
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[1]:
+            best = (game, elapsed)
+    return best
+
+
+def opening():
+    """Build the start position"""
+    game = Game()
+    game.start()
+    return game
+
+
+def bench_parallel(depth, worker_counts):
+    """Time the serial search and ParallelSearch with each worker count on the start and mid-game positions"""
+    for name, position in (("start", opening), ("mid-game", midgame)):
+        game = position()
+        start = time.perf_counter()
+        serial = game.minimax(depth, -math.inf, math.inf, game.player == 'W')
+        base = time.perf_counter() - start
+        print(f"{name} position, depth {depth}: serial {base:.3f}s, move {serial[1]}")
+        for workers in worker_counts:
+            search = ParallelSearch(workers)
+            # Start the worker processes before timing
+            search.minimax(position(), 2, True)
+            game = position()
+            start = time.perf_counter()
+            result = search.minimax(game, depth, game.player == 'W')
+            elapsed = time.perf_counter() - start
+            search.shutdown()
+            check = "same move" if result == serial else f"DIFFERENT: {result}"
+            print(f"  {workers} workers: {elapsed:.3f}s, speedup {base / elapsed:.2f}x, "
+                  f"{search.nodes} nodes, {check}")
+
+
+# Positions of the benchmark suite, in Game.to_notation's form, and the depth each is
+# searched to: every phase of the game, and positions where mills decide the search
+CORPUS = {
+    "opening": ("................ W 0", 8),
+    "placement": ("W...B.W....B.... W 4", 7),
+    "late-placement": ("WW.B.B..WB.B.W.. W 10", 7),
+    "mid-game": ("W.BBW.B..WW.BBW. W 12", 10),
+    "flying": ("W...BB.W.BB..W.B W 12", 5),
+    "mill-heavy": ("WW.BB.B.WW..B.B. W 12", 9),
+}
+# Version of the suite's JSON output
+SUITE_VERSION = 1
+
+
+def search_position(notation, depth, trace_memory=False):
+    """
+    Search a corpus position to depth from a fresh game; return (game,
+    seconds, peak bytes allocated by the search, traced only with
+    trace_memory and None otherwise)
+    """
+    game = Game.from_notation(notation)
+    peak = None
+    # Start tracing after the game and its transposition table are built, so only the search counts
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    game.minimax(depth, -math.inf, math.inf, game.player == 'W')
+    elapsed = time.perf_counter() - start
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return game, elapsed, peak
+
+
+def run_suite(max_depth=None, repeat=3, positions=None):
+    """
+    Search every corpus position to each depth up to its own (or max_depth)
+    and return the results as a JSON-ready dict: per position and depth the
+    best time of repeat searches, nodes, nodes per second, the growth
+    factor (nodes over those of the depth before) and the peak
+    memory allocated during a search, measured in a separate run
+    """
+    results = {}
+    for name, (notation, depth) in CORPUS.items():
+        if positions and name not in positions:
+            continue
+        depths = {}
+        previous = None
+        for d in range(1, min(depth, max_depth or depth) + 1):
+            best = None
+            for _ in range(repeat):
+                game, elapsed, _ = search_position(notation, d)
+                best = elapsed if best is None else min(best, elapsed)
+            # tracemalloc slows the search down, so it gets a run of its own
+            peak = search_position(notation, d, trace_memory=True)[2]
+            depths[str(d)] = {
+                "seconds": best,
+                "nodes": game.nodes,
+                "nodes_per_second": game.nodes / best,
+                "growth_factor": game.nodes / previous if previous else None,
+                "peak_memory": peak,
+            }
+            previous = game.nodes
+            print(f"{name} depth {d}: {best * 1000:.1f}ms, {game.nodes} nodes "
+                  f"({game.nodes / best:,.0f} nodes/sec), peak {peak / 1024:.0f} KiB", file=sys.stderr)
+        results[name] = {"notation": notation, "depths": depths}
+    return {
+        "version": SUITE_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "positions": results,
+    }
+
+
+def compare(results, baseline, threshold, min_seconds=0.05, min_memory=64 * 1024):
+    """
+    Compare suite results with a baseline of the same format and return
+    the lines of a report and whether any search got slower, in nodes per
+    second, by more than threshold (0.1 is 10%). Searches shorter than
+    min_seconds are too noisy to judge. Peak memory more than threshold
+    above the baseline fails too, for searches that allocated at least
+    min_memory bytes in the baseline. A changed node count is reported
+    too: the search itself changed, so its speed cannot be compared.
+    """
+    lines = []
+    failed = False
+    for name, position in results["positions"].items():
+        base = baseline.get("positions", {}).get(name)
+        if base is None or base["notation"] != position["notation"]:
+            lines.append(f"{name}: not in the baseline")
+            continue
+        for depth, result in position["depths"].items():
+            old = base["depths"].get(depth)
+            if old is None:
+                continue
+            label = f"{name} depth {depth}"
+            if old["nodes"] != result["nodes"]:
+                lines.append(f"{label}: {result['nodes']} nodes, {old['nodes']} in the baseline")
+            if old["peak_memory"] >= min_memory:
+                growth = result["peak_memory"] / old["peak_memory"] - 1
+                larger = growth > threshold
+                failed |= larger
+                lines.append(f"{label}: peak {result['peak_memory'] / 1024:,.0f} KiB, {growth:+.0%}"
+                             f"{' MEMORY REGRESSION' if larger else ''}")
+            if min(old["seconds"], result["seconds"]) < min_seconds:
+                continue
+            change = result["nodes_per_second"] / old["nodes_per_second"] - 1
+            slower = change < -threshold
+            failed |= slower
+            lines.append(f"{label}: {result['nodes_per_second']:,.0f} nodes/sec, {change:+.0%}"
+                         f"{' REGRESSION' if slower else ''}")
+    return lines, failed
+
+
+def bench_perft(game, depth):
+    """Print the perft node count of every depth up to depth, with generator speed"""
+    for d in range(1, depth + 1):
+        start = time.perf_counter()
+        nodes = game.perft(d)
+        elapsed = time.perf_counter() - start
+        print(f"perft {d}: {nodes} nodes in {elapsed:.3f}s ({nodes / elapsed:,.0f} nodes/sec)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Game.minimax search speed")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ordering", default=",".join(MOVE_ORDERING),
+                        help="comma-separated move ordering heuristics to enable (%(default)s), empty for none")
+    parser.add_argument("--perft", type=int, metavar="DEPTH",
+                        help="count move generator leaf nodes from the start and mid-game positions instead")
+    parser.add_argument("--parallel", metavar="WORKERS", nargs="?", const="1,2,4,8",
+                        help="compare the serial search with the parallel root search on these "
+                             "comma-separated worker counts (default 1,2,4,8) instead")
+    parser.add_argument("--suite", action="store_true",
+                        help="search every position of the corpus to each depth instead, see --output and --baseline")
+    parser.add_argument("--max-depth", type=int, help="with --suite, search no deeper than this")
+    parser.add_argument("--positions", help="with --suite, comma-separated corpus positions to search (default all)")
+    parser.add_argument("--output", help="with --suite, write the results as JSON to this file")
+    parser.add_argument("--baseline", help="with --suite, compare with the results in this JSON file and "
+                                           "exit with status 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="with --baseline, the slowdown in nodes per second that fails (default %(default)s)")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="with --baseline, ignore searches faster than this many seconds (default %(default)s)")
+    args = parser.parse_args()
+
+    if args.suite:
+        positions = args.positions.split(",") if args.positions else None
+        results = run_suite(args.max_depth, args.repeat, positions)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+        if args.baseline:
+            with open(args.baseline) as file:
+                lines, failed = compare(results, json.load(file), args.threshold, args.min_time)
+            for line in lines:
+                print(line, file=sys.stderr)
+            if failed:
+                sys.exit(1)
+        return
+
+    if args.parallel:
+        bench_parallel(args.depth, [int(n) for n in args.parallel.split(",")])
+        return
+
+    if args.perft:
+        start = Game()
+        start.start()
+        print("start position")
+        bench_perft(start, args.perft)
+        print("mid-game position")
+        bench_perft(midgame(), args.perft)
+        return
+
+    ordering = [name for name in args.ordering.split(",") if name]
+    game, elapsed = bench_minimax(args.depth, args.repeat, ordering)
+    print(f"minimax depth {args.depth}: {game.nodes} nodes in {elapsed:.3f}s "
+          f"({game.nodes / elapsed:,.0f} nodes/sec)")
+    cutoffs = game.cutoffs
+    print(f"cutoffs: {cutoffs} of {game.interior_nodes} interior nodes "
+          f"({cutoffs / max(game.interior_nodes, 1):.0%}), "
+          f"{game.first_move_cutoffs / max(cutoffs, 1):.0%} by the first move")
+
+
+if __name__ == "__main__":
+    main()
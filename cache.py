@@ -0,0 +1,235 @@
+"""
+Search results kept across requests.
+
+The web server answers fixed-depth searches from this cache when it has
+seen the position before, or any of its symmetric images. Results are keyed
+by the canonical Zobrist key of the position, which covers the pieces, the
+player to move and the pieces placed (so the phase), together with the kind
+of search and the depth. Moves are stored as played on the canonical form
+and mapped back onto the position asked about.
+
+A result is only worth sharing if it depends on nothing but the position:
+the server runs the searches it caches fresh, from an empty transposition
+table and move ordering history (see workers.py), so the same position
+always gets the same move. A symmetric image of it gets the image of that
+move, which scores the same but need not be the move a search from the
+image itself would have picked first among equals.
+
+Each result is a 64-bit key and a 64-bit value. By default they are kept in
+an in-process dict in least recently used order. With a path they live in a
+memory-mapped file instead: a hash table of buckets of BUCKET slots, each
+bucket in least recently used order. Several server processes can share the
+file, and it survives restarts. Processes write slots without locking, so a
+slot holds its key XORed with its value and a torn write reads as a miss.
+The number of entries is counted when the file is opened and kept up to
+date by this process's stores, so it misses what other processes store.
+
+    cache = SearchCache(65536, "search-cache.bin")
+    key = cache.key(game, "computer_move", 6)
+    found = cache.get_played(key)
+
+MORRIS_CACHE_SIZE sets the number of results (0 disables the cache) and
+MORRIS_CACHE_FILE the file, if any.
+"""
+import mmap
+import os
+import random
+import struct
+from collections import OrderedDict
+
+from main import (INVERSE_SYMMETRIES, SYMMETRIES, Move, get_move, history_entry, read_history_entry,
+                  transform_move)
+
+CACHE_SIZE = int(os.environ.get("MORRIS_CACHE_SIZE", 1 << 16))
+CACHE_FILE = os.environ.get("MORRIS_CACHE_FILE") or None
+# Searches the cache keeps results of; a minimax result depends on the side maximizing
+KINDS = ('minimax_white', 'minimax_black', 'computer_move', 'remove_best_opponent_piece')
+_random = random.Random(0xCAC4E)
+KIND_KEYS = {kind: _random.getrandbits(64) for kind in KINDS}
+DEPTH_KEYS = [_random.getrandbits(64) for _ in range(256)]
+
+HEADER = struct.Struct('<8sI4x')
+MAGIC = b'MORRISC1'
+SLOT = struct.Struct('<QQ')
+# Slots per bucket of the file
+BUCKET = 4
+# Values hold a 32-bit payload and, above it, a score or depth offset by VALUE_OFFSET,
+# so that no stored value is 0, the mark of an empty slot
+VALUE_OFFSET = 1 << 23
+
+
+class SearchCache:
+    """A size-bounded LRU map from position and search to result, in memory or in a shared file"""
+
+    def __init__(self, size=CACHE_SIZE, path=CACHE_FILE):
+        self.size = size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.map = None
+        self.entries = OrderedDict()
+        if path and size:
+            self._open(path)
+
+    def _open(self, path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if len(header) == HEADER.size and header[:len(MAGIC)] == MAGIC:
+                # Another process or an earlier run made it: keep its size
+                slots = HEADER.unpack(header)[1]
+            else:
+                buckets = 1 << max(0, (self.size // BUCKET).bit_length() - 1)
+                slots = buckets * BUCKET
+                os.ftruncate(fd, HEADER.size + slots * SLOT.size)
+                os.pwrite(fd, HEADER.pack(MAGIC, slots), 0)
+            self.map = mmap.mmap(fd, HEADER.size + slots * SLOT.size)
+        finally:
+            os.close(fd)
+        self.size = slots
+        self.count = sum(1 for offset in range(HEADER.size, len(self.map), SLOT.size)
+                         if SLOT.unpack_from(self.map, offset)[1])
+        self.bucket_mask = slots // BUCKET - 1
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+
+    def __len__(self):
+        if self.map is None:
+            return len(self.entries)
+        return self.count
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "capacity": self.size, "file": self.path if self.map is not None else None,
+                "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0,
+                "stores": self.stores, "evictions": self.evictions}
+
+    def lookup(self, key):
+        """The value stored for key, or None"""
+        if self.map is None:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+        return self._lookup_file(key)
+
+    def _count(self, result):
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def store(self, key, value):
+        if not self.size:
+            return
+        self.stores += 1
+        if self.map is None:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._store_file(key, value)
+
+    def _find(self, key):
+        # Offset of key's bucket and the slot holding key, or None
+        base = HEADER.size + (key & self.bucket_mask) * BUCKET * SLOT.size
+        for n in range(BUCKET):
+            check, value = SLOT.unpack_from(self.map, base + n * SLOT.size)
+            if value and check ^ value == key:
+                return base, n, value
+        return base, None, None
+
+    def _to_front(self, base, n, key, value):
+        # Shift the slots before slot n back one, dropping slot n, and put key first
+        self.map[base + SLOT.size:base + (n + 1) * SLOT.size] = self.map[base:base + n * SLOT.size]
+        SLOT.pack_into(self.map, base, key ^ value, value)
+
+    def _lookup_file(self, key):
+        base, n, value = self._find(key)
+        if n:
+            self._to_front(base, n, key, value)
+        return value
+
+    def _store_file(self, key, value):
+        base, n, _ = self._find(key)
+        if n is None:
+            n = BUCKET - 1
+            if SLOT.unpack_from(self.map, base + n * SLOT.size)[1]:
+                self.evictions += 1
+            else:
+                self.count += 1
+        self._to_front(base, n, key, value)
+
+    @staticmethod
+    def key(game, kind, depth):
+        """(key, symmetry) of a search of kind to depth from the game's position, taken before it can change"""
+        position_key, symmetry = game.canonical_key()
+        return position_key ^ KIND_KEYS[kind] ^ DEPTH_KEYS[depth & 255], symmetry
+
+    def get_minimax(self, key, alpha, beta):
+        """(score, best_move) of a minimax search, if cached with an exact score inside (alpha, beta)"""
+        value = self.lookup(key[0])
+        if value is None or not alpha < (value >> 32) - VALUE_OFFSET < beta:
+            return self._count(None)
+        code = value & 0xFFFFFFFF
+        move = None
+        if code:
+            move = get_move(_point(code & 31), _point(code >> 5 & 31), _point(code >> 10 & 31))
+            move = transform_move(move, INVERSE_SYMMETRIES[key[1]]).to_tuple()
+        return self._count(((value >> 32) - VALUE_OFFSET, move))
+
+    def put_minimax(self, key, alpha, beta, score, best_move):
+        """Keep a minimax result, if its score is exact: inside the (alpha, beta) window searched"""
+        if not alpha < score < beta:
+            return
+        code = 0
+        if best_move is not None:
+            kind, src, dst, removed = transform_move(Move.from_tuple(best_move), key[1])
+            code = 1 << 15 | _code(src) | _code(dst) << 5 | _code(removed) << 10
+        self.store(key[0], (score + VALUE_OFFSET) << 32 | code)
+
+    def get_played(self, key):
+        """(depth searched, history entries played) of a computer_move or removal search, if cached"""
+        value = self.lookup(key[0])
+        if value is None:
+            return self._count(None)
+        symmetry = INVERSE_SYMMETRIES[key[1]]
+        entries = []
+        for shift in (0, 16):
+            code = value >> shift & 0xFFFF
+            if code:
+                entries.append(_transform_entry(code - 1, symmetry))
+        return self._count(((value >> 32) - VALUE_OFFSET, entries))
+
+    def put_played(self, key, depth, entries):
+        """Keep what a computer_move or removal search played: up to two history entries"""
+        if len(entries) > 2:
+            return
+        value = (depth + VALUE_OFFSET) << 32
+        for shift, entry in zip((0, 16), entries):
+            value |= (_transform_entry(entry, key[1]) + 1) << shift
+        self.store(key[0], value)
+
+
+def _code(point):
+    return 0 if point is None else point + 1
+
+
+def _point(code):
+    return None if code == 0 else code - 1
+
+
+def _transform_entry(entry, symmetry):
+    # A history entry moved by one of the SYMMETRIES
+    perm = SYMMETRIES[symmetry]
+    src, dst, player, removal = read_history_entry(entry)
+    return history_entry(None if src is None else perm[src], perm[dst], player, removal)
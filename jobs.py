@@ -0,0 +1,84 @@
+"""
+Background searches of the web server.
+
+A job runs a search for one game as an asyncio task. Clients poll it, wait
+for it or cancel it by its ID; a cancelled search stops at its next check
+and plays the best move of its last completed depth. Finished jobs are kept
+for their results, up to `max_finished` of them, oldest dropped first.
+"""
+import asyncio
+import os
+import secrets
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+MAX_FINISHED = int(os.environ.get("MORRIS_MAX_JOBS", 1000))
+
+
+class Job:
+    """One search: status is 'running', 'done', 'cancelled' (stopped early) or 'failed'"""
+
+    def __init__(self, job_id, game_id):
+        self.id = job_id
+        self.game_id = game_id
+        self.status = 'running'
+        self.result = None
+        self.error = None
+        self.cancel = asyncio.Event()
+        self.task = None
+
+    def to_dict(self):
+        job = {"job_id": self.id, "game_id": self.game_id, "status": self.status}
+        if self.result is not None:
+            job["result"] = self.result
+        if self.error is not None:
+            job["error"] = self.error
+        return job
+
+    async def wait(self, timeout=None):
+        """Wait up to timeout seconds (forever if None) for the job to finish"""
+        if self.task.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class JobStore:
+    """Jobs by ID"""
+
+    def __init__(self, max_finished=MAX_FINISHED):
+        self.max_finished = max_finished
+        self.jobs = {}
+        # IDs of finished jobs, oldest first
+        self.finished = OrderedDict()
+
+    def submit(self, game_id, search):
+        """Start search(cancel), a coroutine function, as a new job and return it"""
+        job = Job(secrets.token_urlsafe(12), game_id)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, search))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def running(self, game_id):
+        """The jobs of a game still searching"""
+        return [job for job in self.jobs.values() if job.game_id == game_id and job.status == 'running']
+
+    async def _run(self, job, search):
+        try:
+            job.result = await search(job.cancel)
+            job.status = 'cancelled' if job.cancel.is_set() else 'done'
+        except HTTPException as error:
+            job.status = 'failed'
+            job.error = {"status_code": error.status_code, "detail": error.detail}
+        except Exception as error:
+            job.status = 'failed'
+            job.error = {"status_code": 500, "detail": repr(error)}
+        self.finished[job.id] = None
+        while len(self.finished) > self.max_finished:
+            self.jobs.pop(self.finished.popitem(last=False)[0], None)
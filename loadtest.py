@@ -0,0 +1,103 @@
+"""
+Load test of the web server's game sessions.
+
+Starts many games through the FastAPI app in process and plays random
+placements in each, interleaved, then reports the memory held per game and
+the latency of the requests. No server needs to be running.
+
+    python loadtest.py --games 1000 --concurrency 50
+"""
+import argparse
+import asyncio
+import copy
+import random
+import time
+import tracemalloc
+
+import httpx
+
+import app
+
+
+def measure(store):
+    """Bytes allocated by a deep copy of the store's games, an estimate of what they hold"""
+    tracemalloc.start()
+    games = copy.deepcopy(store.games)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del games
+    return size
+
+
+async def play(client, game_id, plies, rng, latencies):
+    """Play up to plies random placements (and removals after mills) in one game"""
+    async def request(method, path, **params):
+        params["game_id"] = game_id
+        start = time.perf_counter()
+        response = await client.request(method, path, params=params)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        return response.json()
+
+    state = await request("GET", "/state")
+    for _ in range(plies):
+        placements = [point for kind, point in state["legal_moves"] if kind == 'place']
+        if not placements:
+            return
+        player = state["player"]
+        x, y = rng.choice(placements)
+        state = await request("POST", "/place", x=x, y=y)
+        if state["mill"] and state["removable"]:
+            x, y = rng.choice(state["removable"])
+            state = await request("POST", "/remove_piece", x=x, y=y, player=player)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run(games, plies, concurrency, seed):
+    rng = random.Random(seed)
+    latencies = []
+    # At most concurrency clients are playing at once
+    slots = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        async def client_session():
+            async with slots:
+                start = time.perf_counter()
+                response = await client.post("/start")
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+                await play(client, response.json()["game_id"], plies, rng, latencies)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_session() for _ in range(games)))
+        elapsed = time.perf_counter() - start
+
+    store = app.games
+    live = max(1, len(store))
+    held = measure(store)
+    latencies.sort()
+    print(f"{games} games, {len(latencies)} requests in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.0f} requests/s)")
+    print(f"Sessions: {len(store)} live, {store.evicted} evicted")
+    print(f"Memory: {held / live:.0f} bytes/game measured, {store.bytes / live:.0f} estimated "
+          f"({held / 1024 / 1024:.1f} MiB in all)")
+    print(f"Latency: p50 {percentile(latencies, 0.5) * 1000:.2f}ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f}ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f}ms, max {latencies[-1] * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the web server's game sessions")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--plies", type=int, default=12, help="random placements per game")
+    parser.add_argument("--concurrency", type=int, default=50, help="games played at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.games, args.plies, args.concurrency, args.seed))
+
+
+if __name__ == "__main__":
+    main()
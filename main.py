@@ -1,5 +1,10 @@
-import copy
+import array
+import itertools
 import math
+import os
+import random
+import time
+from collections import namedtuple
 
 class Game:
     visual = [
@@ -44,27 +49,88 @@ class Game:
         [(4, 0), (4, 2), (4, 4)],
     ]
 
-    def __init__(self):
-        self.board = [['*' for j in range(5)] for i in range(5)]
+    # Endgame tablebase or full solution shared by every game, see load_tablebase
+    tablebase = None
+
+    def __init__(self, tt_size=1 << 16, tt_replacement='depth', ordering=None, history_size=None):
+        self.position = Position()
         self.player = 'W'
         self.placed = 0
         self.white = 0
         self.black = 0
-        self.history = []
+        # Placements, movements and removals for undo and redo, the last history_size of them
+        self.history = History(HISTORY_SIZE if history_size is None else history_size)
         self.game_active = False
         self.removed_white = 0
         self.removed_black = 0
+        # Evaluation terms kept up to date as pieces come and go, packed in one int
+        # by pack_terms: each player's lines with two of their pieces and an empty
+        # point, and (piece, empty neighbour) pairs, their steps in the movement phase
+        self.terms = 0
+        # Check the incremental terms against a full recount at every evaluation
+        self.check_incremental = CHECK_INCREMENTAL
+        # Search counters since reset_stats: nodes visited, nodes whose moves were
+        # searched, leaf evaluations, transposition table entries found, beta cutoffs
+        # (by ply) and cutoffs by the first move tried
+        self.nodes = 0
+        self.interior_nodes = 0
+        self.leaf_evaluations = 0
+        self.tt_hits = 0
+        self.cutoffs = 0
+        self.cutoffs_by_ply = []
+        self.first_move_cutoffs = 0
+        self.search_start = time.perf_counter()
+        # search_stats of the last computer_move or remove_best_opponent_piece
+        self.last_search = None
+        # Move ordering heuristics to use, a subset of MOVE_ORDERING (all by default)
+        self.ordering = frozenset(MOVE_ORDERING if ordering is None else ordering)
+        if not self.ordering <= set(MOVE_ORDERING):
+            raise ValueError(f"Unknown move ordering: {', '.join(sorted(self.ordering - set(MOVE_ORDERING)))}")
+        # Quiet moves that caused a cutoff, two per ply, and cutoff credit per side and move
+        self.killers = []
+        self.history_scores = {'W': {}, 'B': {}}
+        # perf_counter() value at which an iterative deepening search gives up
+        self.deadline = None
+        # Called as progress(depth, nodes, best_move) while searching, if set; best_move
+        # is that of the last completed depth (a point for removals), None before one
+        self.progress = None
+        # Cancellation token checked while searching, if set: anything with an is_set()
+        # method, like threading.Event. Once set, an iterative deepening search stops
+        # and keeps its last completed depth
+        self.cancel = None
+        # A parallel.ParallelSearch that fixed-depth computer moves split their root over, if set
+        self.parallel = None
+        self.search_depth = 0
+        self.best_so_far = None
+        self.next_report = 0
+        # Shared by every search in the game, so consecutive computer moves reuse earlier work
+        self.tt = TranspositionTable(tt_size, tt_replacement) if tt_size else None
+
+    @property
+    def board(self):
+        """5x5 grid view of the position ('W', 'B' or '*'), rebuilt on every access"""
+        return self.position.to_grid()
+
+    @board.setter
+    def board(self, grid):
+        self.position = Position.from_grid(grid)
+        self.recount()
 
     def start(self):
-        self.board = [['*' for j in range(5)] for i in range(5)]
+        self.position = Position()
         self.player = 'W'
         self.placed = 0
         self.white = 0
         self.black = 0
         self.removed_white = 0
         self.removed_black = 0
-        self.history = []
+        self.recount()
+        self.history.clear()
         self.game_active = True
+        if self.tt is not None:
+            self.tt.clear()
+        self.killers = []
+        self.history_scores = {'W': {}, 'B': {}}
 
     def switch(self):
         if self.player == 'W':
@@ -73,136 +139,60 @@ class Game:
             self.player = 'W'
 
     def place(self, x, y):
-        if self.placed < 12 and (x, y) in self.adjacent.keys() and self.board[y][x] == '*':
-            # Record complete game state
-            self.history.append((
-                [[self.board[i][j] for j in range(5)] for i in range(5)],
-                self.placed,
-                self.white,
-                self.black,
-                self.removed_white,
-                self.removed_black
-            ))
-            self.board[y][x] = self.player
-            self.placed += 1
-            if self.player == 'W':
-                self.white += 1
-            else:
-                self.black += 1
+        i = INDEX.get((x, y))
+        if i is not None and self.is_legal(None, i):
+            entry = history_entry(None, i, self.player)
+            self.history.push(entry)
+            self.apply(entry)
             return True
         return False
 
     def move(self, x, y, nx, ny):
-        # Check if all pieces are placed
-        if self.placed < 12:
+        # All pieces must be placed, the source must hold one of the player's
+        # pieces and the destination must be an empty adjacent point (any
+        # empty point when flying)
+        i = INDEX.get((x, y))
+        j = INDEX.get((nx, ny))
+        if i is None or j is None or not self.is_legal(i, j):
             return False
-            
-        # Check if source position is valid and contains player's piece
-        if (x, y) not in self.adjacent.keys() or self.board[y][x] != self.player:
-            return False
-            
-        # Check if destination is empty
-        if self.board[ny][nx] != '*':
-            return False
-            
-        # Check if destination is valid
-        if (nx, ny) not in self.adjacent.keys():
-            return False
-            
-        # Check movement rules
-        if self.get_piece_count(self.player) > 3:
-            # Must move to adjacent position
-            if (nx, ny) not in self.adjacent[(x, y)]:
-                return False
-        else:
-            # Can move to any empty position
-            pass
-            
-        # Record complete game state
-        self.history.append((
-            [[self.board[i][j] for j in range(5)] for i in range(5)],
-            self.placed,
-            self.white,
-            self.black,
-            self.removed_white,
-            self.removed_black
-        ))
-        self.board[y][x] = '*'
-        self.board[ny][nx] = self.player
+
+        entry = history_entry(i, j, self.player)
+        self.history.push(entry)
+        self.apply(entry)
         return True
 
     def get_piece_count(self, player):
         """Get the number of pieces on the board for a given player"""
-        count = 0
-        for row in self.board:
-            for cell in row:
-                if cell == player:
-                    count += 1
-        return count
+        return self.position.count(player)
 
     def check_mill(self, x, y, player):
         """Check if placing/moving a piece at (x,y) forms a mill for the given player"""
-        for line in self.lines:
-            if (x, y) in line:
-                # Check if all positions in this line are occupied by the same player
-                all_same = True
-                for px, py in line:
-                    if self.board[py][px] != player:
-                        all_same = False
-                        break
-                if all_same:
-                    return True
-        return False
+        i = INDEX.get((x, y))
+        if i is None:
+            return False
+        return in_mill(self.position.mask(player), i)
 
     def get_opponent_pieces(self, player):
         """Get all pieces of the opponent that can be removed"""
         opponent = 'B' if player == 'W' else 'W'
-        pieces = []
-        
-        # Get all opponent pieces
-        for y in range(5):
-            for x in range(5):
-                if self.board[y][x] == opponent:
-                    pieces.append((x, y))
-        
-        # Check if all opponent pieces are in mills
-        all_in_mills = True
-        for x, y in pieces:
-            if not self.check_mill(x, y, opponent):
-                all_in_mills = False
-                break
-        
-        # If all pieces are in mills, all can be removed
-        if all_in_mills:
-            return pieces
-        
-        # Otherwise, only pieces not in mills can be removed
-        removable = []
-        for x, y in pieces:
-            if not self.check_mill(x, y, opponent):
-                removable.append((x, y))
-        
-        return removable
+        return [POINTS[i] for i in bits(self.position.removable(opponent))]
 
     def remove_piece(self, x, y, player):
         """Remove an opponent's piece"""
         opponent = 'B' if player == 'W' else 'W'
         
-        if self.board[y][x] != opponent:
+        i = INDEX.get((x, y))
+        if i is None or self.position.get(i) != opponent:
             return False
             
         # Check if piece can be removed
-        removable_pieces = self.get_opponent_pieces(player)
-        if (x, y) not in removable_pieces:
+        if not self.position.removable(opponent) >> i & 1:
             return False
-            
-        self.board[y][x] = '*'
-        if opponent == 'W':
-            self.removed_white += 1
-            self.white -= 1
-        else:
-            self.removed_black += 1
-            self.black -= 1
+
+        # Undone together with the placement or movement before it
+        entry = history_entry(None, i, opponent, removal=True)
+        self.history.push(entry)
+        self.apply(entry)
         return True
 
     def check_win(self):
@@ -220,41 +210,123 @@ class Game:
         return False
 
     def has_valid_moves(self, player):
-        """Check if a player has any valid moves"""
-        piece_count = self.get_piece_count(player)
-        
-        if piece_count <= 2:
+        """Check if a player has any valid moves in the movement phase"""
+        count = POPCOUNT[self.position.mask(player)]
+        if count <= 2:
             return False
-            
-        # Check if any piece can move
-        for y in range(5):
-            for x in range(5):
-                if self.board[y][x] == player:
-                    if piece_count > 3:
-                        # Check adjacent moves
-                        for nx, ny in self.adjacent.get((x, y), []):
-                            if self.board[ny][nx] == '*':
-                                return True
-                    else:
-                        # Can move anywhere
-                        for ny_inner in range(5):
-                            for nx_inner in range(5):
-                                if self.board[ny_inner][nx_inner] == '*' and (nx_inner, ny_inner) in self.adjacent:
-                                    return True
+        if count == 3:
+            # Flying: any empty point will do
+            return self.position.empty() != 0
+        return (self.terms >> (WHITE_MOBILITY if player == 'W' else BLACK_MOBILITY) & TERM_MASK) > 0
+
+    def legal_moves(self, removals=True):
+        """
+        Yields the moves of the player to move as interned Move objects. Mill
+        forming moves come once per removable piece unless removals is False.
+        """
+        opponent = 'B' if self.player == 'W' else 'W'
+        return legal_moves(self.position.mask(self.player), self.position.mask(opponent),
+                           self.placed < 12, removals)
+
+    def is_legal(self, src, dst):
+        """Check if the player to move may place at dst (src None) or move src to dst"""
+        for move in self.legal_moves(removals=False):
+            if move.dst == dst and move.src == src:
+                return True
         return False
 
+    def forms_mill(self, move):
+        """Check if a placement or movement closes a mill for the player to move"""
+        own = self.position.mask(self.player)
+        if move.src is not None:
+            own ^= 1 << move.src
+        return in_mill(own | 1 << move.dst, move.dst)
+
     def undo(self):
-        if len(self.history) > 0:
-            # Restore complete game state
-            state = self.history.pop()
-            self.board = state[0]
-            self.placed = state[1]
-            self.white = state[2]
-            self.black = state[3]
-            self.removed_white = state[4]
-            self.removed_black = state[5]
-            return True
-        return False
+        """
+        Takes back the last placement or movement and any removals after it.
+        The player to move is left alone. Returns False if there is none.
+        """
+        entries = self.history.undo()
+        if entries is None:
+            return False
+        for entry in entries:
+            self.apply(entry, undo=True)
+        return True
+
+    def redo(self):
+        """Plays again what the last undo took back, if nothing was played since; False if not"""
+        entries = self.history.redo()
+        if entries is None:
+            return False
+        for entry in entries:
+            self.apply(entry)
+        return True
+
+    def apply(self, entry, undo=False):
+        """Makes the placement, movement or removal of a history entry, or takes it back"""
+        src, dst, player, removal = read_history_entry(entry)
+        position = self.position
+        if removal:
+            sign = -1 if undo else 1
+            if undo:
+                position.set(dst, player)
+            else:
+                position.clear(dst)
+            if player == 'W':
+                self.white -= sign
+                self.removed_white += sign
+            else:
+                self.black -= sign
+                self.removed_black += sign
+        elif undo:
+            position.clear(dst)
+            if src is None:
+                self.placed -= 1
+                if player == 'W':
+                    self.white -= 1
+                else:
+                    self.black -= 1
+            else:
+                position.set(src, player)
+        else:
+            if src is None:
+                self.placed += 1
+                if player == 'W':
+                    self.white += 1
+                else:
+                    self.black += 1
+            else:
+                position.clear(src)
+            position.set(dst, player)
+        self.recount()
+
+    def winner(self):
+        """The player who has won ('W' or 'B'), or None while the game goes on"""
+        if self.placed < 12:
+            return None
+        for player, opponent in (('W', 'B'), ('B', 'W')):
+            if self.get_piece_count(opponent) <= 2 or not self.has_valid_moves(opponent):
+                return player
+        return None
+
+    def state(self):
+        """Everything a client shows about the game, as one JSON-ready dict"""
+        return {
+            "board": self.board,
+            "player": self.player,
+            "phase": "placement" if self.placed < 12 else "movement",
+            "placed": self.placed,
+            "pieces": {"W": self.get_piece_count('W'), "B": self.get_piece_count('B')},
+            "removed": {"W": self.removed_white, "B": self.removed_black},
+            "game_active": self.game_active,
+            "winner": self.winner(),
+            # Placements/movements of the player to move, without the removals after a mill
+            "legal_moves": [move.to_tuple()[:-1] for move in self.legal_moves(removals=False)],
+            # Opponent pieces the player to move may take after closing a mill
+            "removable": self.get_opponent_pieces(self.player),
+            "notation": self.to_notation(),
+        }
 
     def display_board(self):
         """Display the current board state using the visual representation"""
@@ -291,9 +363,10 @@ class Game:
                 visual_to_real[(vx, vy)] = real_positions[i]
         
         # Replace '*' in visual board with actual pieces
+        board = self.board
         for (vx, vy), (rx, ry) in visual_to_real.items():
             if 0 <= vy < len(visual_board) and 0 <= vx < len(visual_board[vy]):
-                piece = self.board[ry][rx]
+                piece = board[ry][rx]
                 visual_board[vy] = visual_board[vy][:vx] + piece + visual_board[vy][vx+1:]
         
         # Display the visual board
@@ -307,36 +380,62 @@ class Game:
 
     def get_unblocked_two_in_a_rows(self, player):
         """Counts the number of unblocked 2-in-a-rows for a player."""
-        count = 0
-        for line in self.lines:
-            player_pieces = 0
-            empty_spaces = 0
-            for x, y in line:
-                if self.board[y][x] == player:
-                    player_pieces += 1
-                elif self.board[y][x] == '*':
-                    empty_spaces += 1
-            if player_pieces == 2 and empty_spaces == 1:
-                count += 1
-        return count
+        return self.position.two_in_a_rows(player)
 
     def evaluate(self):
         """
         Evaluates the current board state.
-        - White winning: +infinity
-        - Black winning: -infinity
+        - White winning: WIN_SCORE
+        - Black winning: -WIN_SCORE
         - White's pieces vs Black's pieces
         - White's unblocked 2-in-a-rows vs Black's
+
+        Reads the incrementally kept terms, so it takes constant time; the
+        score is the same as evaluate_full's.
         """
-        if self.check_win():
-            return math.inf if self.player == 'W' else -math.inf
+        if self.check_incremental:
+            self.verify_incremental()
+        if self.placed >= 12:
+            outcome = self.outcome()
+            if outcome:
+                return outcome * WIN_SCORE if self.player == 'W' else -outcome * WIN_SCORE
+        position = self.position
+        terms = self.terms
+        return ((POPCOUNT[position.white] - POPCOUNT[position.black]) * 10
+                + ((terms >> WHITE_TWOS & TERM_MASK) - (terms >> BLACK_TWOS & TERM_MASK)) * 5)
 
-        # Temporarily switch player to check opponent's win condition
-        self.switch()
-        if self.check_win():
-            self.switch() # Switch back
-            return -math.inf if self.player == 'W' else math.inf
-        self.switch() # Switch back
+    def outcome(self):
+        """
+        For a movement-phase position, 1 if the player to move has won, -1
+        if they have lost and 0 while the game goes on, in constant time. A
+        player with two pieces or no move has lost, as in check_win, and the
+        player to move's win counts first.
+        """
+        position = self.position
+        if self.player == 'W':
+            own, other = position.white, position.black
+            own_mobility, other_mobility = self.terms >> WHITE_MOBILITY & TERM_MASK, self.terms >> BLACK_MOBILITY
+        else:
+            own, other = position.black, position.white
+            own_mobility, other_mobility = self.terms >> BLACK_MOBILITY, self.terms >> WHITE_MOBILITY & TERM_MASK
+        # With three pieces a player flies, and can unless the board is full
+        count = POPCOUNT[other]
+        if count <= 2 or (not other_mobility if count > 3 else own | other == FULL):
+            return 1
+        count = POPCOUNT[own]
+        if count <= 2 or (not own_mobility if count > 3 else own | other == FULL):
+            return -1
+        return 0
+
+    def evaluate_full(self):
+        """evaluate computed from the board alone, without the incremental terms"""
+        if self.placed >= 12:
+            for player, sign in ((self.player, 1), ('B' if self.player == 'W' else 'W', -1)):
+                opponent = self.position.mask('B' if player == 'W' else 'W')
+                # The opponent has two pieces or no move
+                if POPCOUNT[opponent] <= 2 or next(legal_moves(opponent, self.position.mask(player),
+                                                               False, removals=False), None) is None:
+                    return sign * (WIN_SCORE if self.player == 'W' else -WIN_SCORE)
 
         white_pieces = self.get_piece_count('W')
         black_pieces = self.get_piece_count('B')
@@ -345,326 +444,695 @@ class Game:
 
         score = (white_pieces - black_pieces) * 10 + \
                 (white_2_rows - black_2_rows) * 5
-        
+
         return score
 
-    def minimax(self, depth, alpha, beta, maximizing_player):
-        if depth == 0 or self.check_win():
-            return self.evaluate(), None
+    def incremental_terms(self):
+        """The incremental evaluation terms counted from the board, unpacked as in unpack_terms"""
+        white, black = self.position.white, self.position.black
+        empty = FULL ^ (white | black)
+        return (self.position.two_in_a_rows('W'), self.position.two_in_a_rows('B'),
+                sum(POPCOUNT[ADJACENT_MASKS[i] & empty] for i in bits(white)),
+                sum(POPCOUNT[ADJACENT_MASKS[i] & empty] for i in bits(black)))
 
-        if maximizing_player:
-            max_eval = -math.inf
-            best_move = None
-            
-            # Placement Phase
-            if self.placed < 12:
-                for y in range(5):
-                    for x in range(5):
-                        if (x,y) in self.adjacent and self.board[y][x] == '*':
-                            temp_game = copy.deepcopy(self)
-                            temp_game.place(x, y)
-                            if temp_game.check_mill(x, y, temp_game.player):
-                                # If a mill is formed, find best piece to remove
-                                for rx, ry in temp_game.get_opponent_pieces(temp_game.player):
-                                    mill_game = copy.deepcopy(temp_game)
-                                    mill_game.remove_piece(rx, ry, mill_game.player)
-                                    mill_game.switch()
-                                    evaluation, _ = mill_game.minimax(depth - 1, alpha, beta, False)
-                                    if evaluation > max_eval:
-                                        max_eval = evaluation
-                                        best_move = ('place', (x, y), (rx, ry))
-                                    alpha = max(alpha, evaluation)
-                                    if beta <= alpha:
-                                        break
-                                if beta <= alpha:
-                                    break
-                            else:
-                                temp_game.switch()
-                                evaluation, _ = temp_game.minimax(depth - 1, alpha, beta, False)
-                                if evaluation > max_eval:
-                                    max_eval = evaluation
-                                    best_move = ('place', (x, y), None)
-                                alpha = max(alpha, evaluation)
-                                if beta <= alpha:
-                                    break
-                    if beta <= alpha:
-                        break
-            # Movement Phase
+    def recount(self):
+        """Set the incremental evaluation terms from the board, after changing it other than by make_move"""
+        self.terms = pack_terms(*self.incremental_terms())
+
+    def verify_incremental(self):
+        """Raise AssertionError if the incremental evaluation terms differ from a full recount"""
+        kept = unpack_terms(self.terms)
+        counted = self.incremental_terms()
+        if kept != counted:
+            raise AssertionError(f"Incremental evaluation terms {kept} should be {counted} "
+                                 f"at {self.to_notation()}")
+
+    def make_move(self, move):
+        """
+        Plays a Move in place, without validation or history, and hands the
+        turn to the opponent, updating the incremental evaluation terms.
+        Returns the undo record to pass to unmake_move.
+        """
+        kind, src, dst, removed = move
+        position = self.position
+        white, black = position.white, position.black
+        record = (move, self.terms)
+        terms = self.terms
+        # Each point changes with the terms of its piece taking it from the board without it
+        if self.player == 'W':
+            if dst is not None:
+                if src is None:
+                    self.placed += 1
+                    self.white += 1
+                else:
+                    white ^= 1 << src
+                    region = TERM_REGIONS[src]
+                    terms -= WHITE_TERMS[src][white & region | (black & region) << 16]
+                region = TERM_REGIONS[dst]
+                terms += WHITE_TERMS[dst][white & region | (black & region) << 16]
+                white |= 1 << dst
+            if removed is not None:
+                black ^= 1 << removed
+                region = TERM_REGIONS[removed]
+                terms -= BLACK_TERMS[removed][white & region | (black & region) << 16]
+                self.black -= 1
+                self.removed_black += 1
+            self.player = 'B'
+        else:
+            if dst is not None:
+                if src is None:
+                    self.placed += 1
+                    self.black += 1
+                else:
+                    black ^= 1 << src
+                    region = TERM_REGIONS[src]
+                    terms -= BLACK_TERMS[src][white & region | (black & region) << 16]
+                region = TERM_REGIONS[dst]
+                terms += BLACK_TERMS[dst][white & region | (black & region) << 16]
+                black |= 1 << dst
+            if removed is not None:
+                white ^= 1 << removed
+                region = TERM_REGIONS[removed]
+                terms -= WHITE_TERMS[removed][white & region | (black & region) << 16]
+                self.white -= 1
+                self.removed_white += 1
+            self.player = 'W'
+        position.white, position.black = white, black
+        self.terms = terms
+        return record
+
+    def unmake_move(self, record):
+        """Takes back a move played with make_move"""
+        move, self.terms = record
+        kind, src, dst, removed = move
+        self.switch()
+        position = self.position
+        if removed is not None:
+            if self.player == 'W':
+                position.black |= 1 << removed
+                self.black += 1
+                self.removed_black -= 1
             else:
-                for y in range(5):
-                    for x in range(5):
-                        if self.board[y][x] == self.player:
-                            # Fly rule
-                            if self.get_piece_count(self.player) == 3:
-                                for ny in range(5):
-                                    for nx in range(5):
-                                        if (nx, ny) in self.adjacent and self.board[ny][nx] == '*':
-                                            temp_game = copy.deepcopy(self)
-                                            temp_game.move(x, y, nx, ny)
-                                            if temp_game.check_mill(nx, ny, temp_game.player):
-                                                 for rx, ry in temp_game.get_opponent_pieces(temp_game.player):
-                                                    mill_game = copy.deepcopy(temp_game)
-                                                    mill_game.remove_piece(rx, ry, mill_game.player)
-                                                    mill_game.switch()
-                                                    evaluation, _ = mill_game.minimax(depth - 1, alpha, beta, False)
-                                                    if evaluation > max_eval:
-                                                        max_eval = evaluation
-                                                        best_move = ('move', (x, y), (nx, ny), (rx, ry))
-                                                    alpha = max(alpha, evaluation)
-                                                    if beta <= alpha:
-                                                        break
-                                                 if beta <= alpha:
-                                                    break
-                                            else:
-                                                temp_game.switch()
-                                                evaluation, _ = temp_game.minimax(depth - 1, alpha, beta, False)
-                                                if evaluation > max_eval:
-                                                    max_eval = evaluation
-                                                    best_move = ('move', (x, y), (nx, ny), None)
-                                                alpha = max(alpha, evaluation)
-                                                if beta <= alpha:
-                                                    break
-                                    if beta <= alpha:
-                                        break
-                            # Normal move
-                            else:
-                                for nx, ny in self.adjacent.get((x, y), []):
-                                    if self.board[ny][nx] == '*':
-                                        temp_game = copy.deepcopy(self)
-                                        temp_game.move(x, y, nx, ny)
-                                        if temp_game.check_mill(nx, ny, temp_game.player):
-                                            for rx, ry in temp_game.get_opponent_pieces(temp_game.player):
-                                                mill_game = copy.deepcopy(temp_game)
-                                                mill_game.remove_piece(rx, ry, mill_game.player)
-                                                mill_game.switch()
-                                                evaluation, _ = mill_game.minimax(depth - 1, alpha, beta, False)
-                                                if evaluation > max_eval:
-                                                    max_eval = evaluation
-                                                    best_move = ('move', (x, y), (nx, ny), (rx, ry))
-                                                alpha = max(alpha, evaluation)
-                                                if beta <= alpha:
-                                                    break
-                                            if beta <= alpha:
-                                                break
-                                        else:
-                                            temp_game.switch()
-                                            evaluation, _ = temp_game.minimax(depth - 1, alpha, beta, False)
-                                            if evaluation > max_eval:
-                                                max_eval = evaluation
-                                                best_move = ('move', (x, y), (nx, ny), None)
-                                            alpha = max(alpha, evaluation)
-                                            if beta <= alpha:
-                                                break
-                        if beta <= alpha:
-                            break
-                    if beta <= alpha:
-                        break
-            return max_eval, best_move
-        
-        else: # Minimizing player
-            min_eval = math.inf
-            best_move = None
-            
-            # Placement Phase
-            if self.placed < 12:
-                for y in range(5):
-                    for x in range(5):
-                        if (x,y) in self.adjacent and self.board[y][x] == '*':
-                            temp_game = copy.deepcopy(self)
-                            temp_game.place(x, y)
-                            if temp_game.check_mill(x, y, temp_game.player):
-                                for rx, ry in temp_game.get_opponent_pieces(temp_game.player):
-                                    mill_game = copy.deepcopy(temp_game)
-                                    mill_game.remove_piece(rx, ry, mill_game.player)
-                                    mill_game.switch()
-                                    evaluation, _ = mill_game.minimax(depth - 1, alpha, beta, True)
-                                    if evaluation < min_eval:
-                                        min_eval = evaluation
-                                        best_move = ('place', (x, y), (rx, ry))
-                                    beta = min(beta, evaluation)
-                                    if beta <= alpha:
-                                        break
-                                if beta <= alpha:
-                                    break
-                            else:
-                                temp_game.switch()
-                                evaluation, _ = temp_game.minimax(depth - 1, alpha, beta, True)
-                                if evaluation < min_eval:
-                                    min_eval = evaluation
-                                    best_move = ('place', (x, y), None)
-                                beta = min(beta, evaluation)
-                                if beta <= alpha:
-                                    break
-                    if beta <= alpha:
-                        break
-            # Movement Phase
+                position.white |= 1 << removed
+                self.white += 1
+                self.removed_white -= 1
+        if dst is not None:
+            if self.player == 'W':
+                position.white ^= 1 << dst
+                if src is None:
+                    self.placed -= 1
+                    self.white -= 1
+                else:
+                    position.white |= 1 << src
             else:
-                for y in range(5):
-                    for x in range(5):
-                        if self.board[y][x] == self.player:
-                            # Fly rule
-                            if self.get_piece_count(self.player) == 3:
-                                for ny in range(5):
-                                    for nx in range(5):
-                                        if (nx, ny) in self.adjacent and self.board[ny][nx] == '*':
-                                            temp_game = copy.deepcopy(self)
-                                            temp_game.move(x, y, nx, ny)
-                                            if temp_game.check_mill(nx, ny, temp_game.player):
-                                                for rx, ry in temp_game.get_opponent_pieces(temp_game.player):
-                                                    mill_game = copy.deepcopy(temp_game)
-                                                    mill_game.remove_piece(rx, ry, mill_game.player)
-                                                    mill_game.switch()
-                                                    evaluation, _ = mill_game.minimax(depth - 1, alpha, beta, True)
-                                                    if evaluation < min_eval:
-                                                        min_eval = evaluation
-                                                        best_move = ('move', (x, y), (nx, ny), (rx, ry))
-                                                    beta = min(beta, evaluation)
-                                                    if beta <= alpha:
-                                                        break
-                                                if beta <= alpha:
-                                                    break
-                                            else:
-                                                temp_game.switch()
-                                                evaluation, _ = temp_game.minimax(depth - 1, alpha, beta, True)
-                                                if evaluation < min_eval:
-                                                    min_eval = evaluation
-                                                    best_move = ('move', (x, y), (nx, ny), None)
-                                                beta = min(beta, evaluation)
-                                                if beta <= alpha:
-                                                    break
-                                    if beta <= alpha:
-                                        break
-                            # Normal move
-                            else:
-                                for nx, ny in self.adjacent.get((x, y), []):
-                                    if self.board[ny][nx] == '*':
-                                        temp_game = copy.deepcopy(self)
-                                        temp_game.move(x, y, nx, ny)
-                                        if temp_game.check_mill(nx, ny, temp_game.player):
-                                            for rx, ry in temp_game.get_opponent_pieces(temp_game.player):
-                                                mill_game = copy.deepcopy(temp_game)
-                                                mill_game.remove_piece(rx, ry, mill_game.player)
-                                                mill_game.switch()
-                                                evaluation, _ = mill_game.minimax(depth - 1, alpha, beta, True)
-                                                if evaluation < min_eval:
-                                                    min_eval = evaluation
-                                                    best_move = ('move', (x, y), (nx, ny), (rx, ry))
-                                                beta = min(beta, evaluation)
-                                                if beta <= alpha:
-                                                    break
-                                            if beta <= alpha:
-                                                break
-                                        else:
-                                            temp_game.switch()
-                                            evaluation, _ = temp_game.minimax(depth - 1, alpha, beta, True)
-                                            if evaluation < min_eval:
-                                                min_eval = evaluation
-                                                best_move = ('move', (x, y), (nx, ny), None)
-                                            beta = min(beta, evaluation)
-                                            if beta <= alpha:
-                                                break
-                        if beta <= alpha:
-                            break
-                    if beta <= alpha:
-                        break
-            return min_eval, best_move
+                position.black ^= 1 << dst
+                if src is None:
+                    self.placed -= 1
+                    self.black -= 1
+                else:
+                    position.black |= 1 << src
 
-    def computer_move(self, depth):
-        """Makes a move for the computer based on the priority list."""
+    def perft(self, depth):
+        """Counts the leaf nodes of the legal move tree to the given depth"""
+        if self.placed >= 12 and self.get_piece_count(self.player) <= 2:
+            return 0
+        if depth == 0:
+            return 1
+        nodes = 0
+        for move in self.legal_moves():
+            record = self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move(record)
+        return nodes
+
+    def canonical_key(self):
+        """
+        Zobrist key of the canonical form of the position, the same for all
+        its symmetric images, and the symmetry that maps the position to it
+        """
+        symmetry, white, black = canonical_form(self.position.white, self.position.black)
+        low, high = ZOBRIST_WHITE_BYTES
+        key = ZOBRIST_PLACED[self.placed] ^ low[white & 255] ^ high[white >> 8]
+        low, high = ZOBRIST_BLACK_BYTES
+        key ^= low[black & 255] ^ high[black >> 8]
+        if self.player == 'B':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key, symmetry
+
+    def unique_moves(self, moves):
+        """
+        Drops moves that lead to a position symmetric to the one an earlier
+        move leads to, which only happens when the position itself is
+        symmetric
+        """
+        white, black = self.position.white, self.position.black
+        stabilizer = [s for s in range(1, len(SYMMETRIES))
+                      if transform(white, s) == white and transform(black, s) == black]
+        if not stabilizer:
+            return moves
+        seen = set()
+        unique = []
+        for move in moves:
+            if move not in seen:
+                unique.append(move)
+                seen.update(transform_move(move, s) for s in stabilizer)
+        return unique
+
+    @classmethod
+    def load_tablebase(cls, path):
+        """Memory-map a tablebase built by tablebase.py or solver.py for all games to probe"""
+        from tablebase import Tablebase
+        cls.tablebase = Tablebase(path)
+
+    def probe_tablebase(self, ply=0):
+        """
+        Exact score of the position from the tablebase, or None if no
+        tablebase is loaded or it does not cover the position (placement
+        positions are only covered by the full solution of solver.py). Wins
+        score WIN_SCORE less the plies to the end, counting ply plies
+        already played in the search, so faster wins and slower losses are
+        preferred.
+        """
+        if self.tablebase is None:
+            return None
+        opponent = 'B' if self.player == 'W' else 'W'
+        result = self.tablebase.probe_position(self.position.mask(self.player), self.position.mask(opponent),
+                                               self.placed)
+        if result is None:
+            return None
+        outcome, distance = result
+        if outcome == 0:
+            return 0
+        score = WIN_SCORE - ply - distance if outcome > 0 else ply + distance - WIN_SCORE
+        return score if self.player == 'W' else -score
+
+    def tablebase_move(self, maximizing_player):
+        """
+        The exact score and best Move (None if there are no moves) of a
+        position the tablebase covers, by probing every child. Returns None
+        if the position or one of its children is not covered.
+        """
+        score = self.probe_tablebase()
+        if score is None:
+            return None
+        best_score, best_move = None, None
+        for move in self.legal_moves():
+            record = self.make_move(move)
+            child = self.probe_tablebase()
+            self.unmake_move(record)
+            if child is None:
+                return None
+            if best_score is None or (child > best_score if maximizing_player else child < best_score):
+                best_score, best_move = child, move
+        return score, best_move
+
+    def solution(self):
+        """
+        Value of the position for the player to move and a best move, looked
+        up in the tablebase without searching: (1 win, 0 draw or -1 loss,
+        plies to the end or None for a draw, move tuple or None). Returns
+        None if the tablebase does not cover the position.
+        """
+        if self.tablebase is None:
+            return None
         opponent = 'B' if self.player == 'W' else 'W'
+        result = self.tablebase.probe_position(self.position.mask(self.player), self.position.mask(opponent),
+                                               self.placed)
+        found = self.tablebase_move(self.player == 'W') if result is not None else None
+        if found is None:
+            return None
+        best_move = found[1]
+        return result[0], result[1], best_move.to_tuple() if best_move else None
+
+    def minimax(self, depth, alpha, beta, maximizing_player, first_move=None):
+        """
+        Alpha-beta search to a fixed depth, maximizing the score (positive
+        for White) if maximizing_player and minimizing it otherwise. Returns
+        (score, best_move); wins score WIN_SCORE less the plies to the end.
+        first_move, in the same format as the returned move, is tried before
+        any other move at the root. Positions covered by the tablebase are
+        answered from it. Raises ValueError for a negative depth.
+        """
+        if depth < 0:
+            raise ValueError(f"Search depth must not be negative, not {depth}")
+        if self.tablebase is not None:
+            result = self.tablebase_move(maximizing_player)
+            if result is not None:
+                score, best_move = result
+                return score, best_move.to_tuple() if best_move else None
+        if self.tt is not None:
+            self.tt.new_search()
+        while len(self.killers) < depth:
+            self.killers.append([None, None])
+        while len(self.cutoffs_by_ply) < depth:
+            self.cutoffs_by_ply.append(0)
+        if first_move is not None:
+            first_move = Move.from_tuple(first_move)
+        # The negamax search scores for the side maximizing at each node
+        color = 1 if maximizing_player else -1
+        if not maximizing_player:
+            alpha, beta = -beta, -alpha
+        score, best_move = self._search(depth, alpha, beta, color, first_move)
+        return color * score, best_move.to_tuple() if best_move else None
+
+    def reset_stats(self):
+        """Zero the search counters and start the clock for search_stats"""
+        self.nodes = self.interior_nodes = self.leaf_evaluations = self.tt_hits = 0
+        self.cutoffs = self.first_move_cutoffs = 0
+        self.cutoffs_by_ply = []
+        self.search_start = time.perf_counter()
+
+    def search_stats(self, depth=None, pv=None):
+        """
+        The search counters since reset_stats as a dict: nodes, interior
+        nodes, leaf evaluations, transposition table hits, beta cutoffs in
+        all and by ply from the root, the share of cutoffs by the first move,
+        the effective branching factor (the depth-th root of the nodes), the
+        time elapsed and nodes per second, with the depth searched and the
+        principal variation if given
+        """
+        elapsed = time.perf_counter() - self.search_start
+        cutoffs_by_ply = list(self.cutoffs_by_ply)
+        while cutoffs_by_ply and not cutoffs_by_ply[-1]:
+            cutoffs_by_ply.pop()
+        return {
+            "depth": depth,
+            "nodes": self.nodes,
+            "interior_nodes": self.interior_nodes,
+            "leaf_evaluations": self.leaf_evaluations,
+            "tt_hits": self.tt_hits,
+            "cutoffs": self.cutoffs,
+            "cutoffs_by_ply": cutoffs_by_ply,
+            "first_move_cutoff_rate": self.first_move_cutoffs / self.cutoffs if self.cutoffs else None,
+            "branching_factor": self.nodes ** (1 / depth) if depth and self.nodes else None,
+            "elapsed_ms": elapsed * 1000,
+            "nodes_per_second": self.nodes / elapsed if elapsed > 0 else None,
+            "pv": pv,
+        }
+
+    def principal_variation(self, maximizing_player, depth, first_move=None):
+        """
+        The line the last search expects from here, up to depth moves, as
+        move tuples: first_move if given (as minimax returns it), then the
+        best move stored in the transposition table for each position in
+        turn, as long as there is one and it is legal
+        """
+        line = []
+        records = []
+        color = 1 if maximizing_player else -1
+        seen = set()
+        if first_move is not None:
+            line.append(first_move)
+            records.append(self.make_move(Move.from_tuple(first_move)))
+            color = -color
+        while self.tt is not None and len(line) < depth:
+            key, symmetry = self.canonical_key()
+            if color > 0:
+                key ^= ZOBRIST_MAXIMIZING
+            entry = self.tt.probe(key)
+            if entry is None or entry[3] is None or key in seen:
+                break
+            seen.add(key)
+            move = transform_move(entry[3], INVERSE_SYMMETRIES[symmetry])
+            if move not in self.legal_moves():
+                break
+            line.append(move.to_tuple())
+            records.append(self.make_move(move))
+            color = -color
+        for record in reversed(records):
+            self.unmake_move(record)
+        return line
+
+    def iterative_deepening(self, time_ms, maximizing_player, max_depth=None):
+        """
+        Searches depth 1, 2, ... until time_ms milliseconds have passed or
+        max_depth is reached, starting each iteration with the previous best
+        move and an aspiration window around its score. Returns (score,
+        best_move, depth) of the deepest completed iteration; depth 1 always
+        completes.
+        """
+        score = None
+        best_move = None
+
+        def search(depth):
+            nonlocal score, best_move
+            window = (-math.inf, math.inf)
+            if score is not None and abs(score) < WIN_THRESHOLD:
+                window = (score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW)
+            result = self.minimax(depth, window[0], window[1], maximizing_player, best_move)
+            if not window[0] < result[0] < window[1]:
+                # Outside the window the score is only a bound, so search again in full
+                result = self.minimax(depth, -math.inf, math.inf, maximizing_player, best_move)
+            score, best_move = result
+            return result
+
+        (score, best_move), depth = self._deepen(search, time_ms, max_depth)
+        return score, best_move, depth
+
+    def _deepen(self, search, time_ms, max_depth=None):
+        """
+        Calls search(depth) for increasing depths within the time budget and
+        returns ((score, move), depth) of the last call that finished. A call
+        cut short by the deadline is discarded and the game state restored.
+        """
+        deadline = time.perf_counter() + time_ms / 1000
+        self.search_depth, self.best_so_far = 1, None
+        result = search(1)
+        reached = 1
+        self.best_so_far = result[1]
+        self.report()
+        for depth in range(2, (max_depth or MAX_SEARCH_DEPTH) + 1):
+            # A forced win or loss will not change with more depth
+            if abs(result[0]) >= WIN_THRESHOLD or time.perf_counter() >= deadline or self.cancelled():
+                break
+            state = self.snapshot()
+            self.deadline = deadline
+            self.search_depth = depth
+            try:
+                result = search(depth)
+            except SearchTimeout:
+                self.restore(state)
+                break
+            finally:
+                self.deadline = None
+            reached = depth
+            self.best_so_far = result[1]
+            self.report()
+        return result, reached
+
+    def poll(self):
+        """
+        Called by the search every 1024 nodes: gives up once the deadline has
+        passed or the search is cancelled, and reports progress at most every
+        PROGRESS_INTERVAL seconds.
+        """
+        now = time.perf_counter()
+        if self.deadline is not None and (now >= self.deadline or self.cancelled()):
+            raise SearchTimeout
+        if self.progress is not None and now >= self.next_report:
+            self.report()
+
+    def cancelled(self):
+        return self.cancel is not None and self.cancel.is_set()
+
+    def report(self):
+        """Send a progress report, if anyone is listening"""
+        if self.progress is not None:
+            self.next_report = time.perf_counter() + PROGRESS_INTERVAL
+            self.progress(self.search_depth, self.nodes, self.best_so_far)
+
+    def to_notation(self):
+        """
+        The position as text: the 16 points in POINTS order ('W', 'B' or '.'),
+        the player to move and the number of pieces placed so far, e.g.
+        'W..B............ W 2'
+        """
+        return f"{encode_points(self.position.white, self.position.black)} {self.player} {self.placed}"
+
+    @classmethod
+    def from_notation(cls, notation, **kwargs):
+        """
+        A started game at the position given in to_notation's form, with
+        the removal counts implied by it. Raises ValueError if the notation
+        is malformed or the position impossible. kwargs go to Game().
+        """
+        fields = notation.split()
+        if len(fields) != 3 or fields[1] not in ('W', 'B') or not fields[2].isdigit():
+            raise ValueError(f"Bad position notation: {notation!r}")
+        white, black = decode_points(fields[0])
+        return cls.at_position(white, black, fields[1], int(fields[2]), **kwargs)
+
+    def to_packed(self):
+        """The position as the 5 bytes of pack_position"""
+        return pack_position(self.position.white, self.position.black, self.player, self.placed)
+
+    @classmethod
+    def from_packed(cls, data, **kwargs):
+        """A started game at a position from to_packed, like from_notation"""
+        return cls.at_position(*unpack_position(data), **kwargs)
+
+    @classmethod
+    def at_position(cls, white, black, player, placed, **kwargs):
+        """
+        A started game with the given piece masks, player to move and pieces
+        placed, and the removal counts implied by them. Raises ValueError
+        for an impossible position. kwargs go to Game().
+        """
+        # White places first, so it has placed the odd piece
+        placed_white, placed_black = (placed + 1) // 2, placed // 2
+        if placed > 12 or white & black or white > FULL or black > FULL:
+            raise ValueError(f"Impossible position: {encode_points(white & FULL, black & FULL)} {player} {placed}")
+        if POPCOUNT[white] > placed_white or POPCOUNT[black] > placed_black:
+            raise ValueError(f"More pieces on the board than placed: {encode_points(white, black)} {player} {placed}")
+        game = cls(**kwargs)
+        game.start()
+        game.position = Position(white, black)
+        game.recount()
+        game.player = player
+        game.placed = placed
+        game.white, game.black = POPCOUNT[white], POPCOUNT[black]
+        game.removed_white, game.removed_black = placed_white - game.white, placed_black - game.black
+        return game
+
+    def snapshot(self):
+        """The pieces, player to move and counters as a tuple, for restore"""
+        return (self.position.white, self.position.black, self.player, self.placed, self.white,
+                self.black, self.removed_white, self.removed_black)
+
+    def restore(self, state):
+        """Go back to a state returned by snapshot (the history is left alone)"""
+        (self.position.white, self.position.black, self.player, self.placed, self.white,
+         self.black, self.removed_white, self.removed_black) = state
+        self.recount()
+
+    def _search(self, depth, alpha, beta, color, first_move=None, ply=0):
+        """
+        Negamax alpha-beta with principal variation search. Scores are
+        integers from the point of view of the side maximizing at this node:
+        the White score times color. Returns (score, best Move or None).
+        """
+        self.nodes += 1
+        if not self.nodes & 1023:
+            self.poll()
+        if self.tablebase is not None:
+            score = self.probe_tablebase(ply)
+            if score is not None:
+                return color * score, None
+        tt = self.tt
+        tt_move = None
+        if tt is not None:
+            # Symmetric positions share an entry, with its move stored for the canonical form
+            key, symmetry = self.canonical_key()
+            if color > 0:
+                key ^= ZOBRIST_MAXIMIZING
+            entry = tt.probe(key)
+            if entry is not None:
+                self.tt_hits += 1
+                tt_depth, flag, score, tt_move = entry
+                score = from_tt_score(score, ply)
+                if tt_move is not None:
+                    tt_move = transform_move(tt_move, INVERSE_SYMMETRIES[symmetry])
+                if tt_depth >= depth:
+                    if flag == TranspositionTable.EXACT:
+                        return score, tt_move
+                    if flag == TranspositionTable.LOWER:
+                        alpha = max(alpha, score)
+                    else:
+                        beta = min(beta, score)
+                    if alpha >= beta:
+                        return score, tt_move
+
+        # White's sign when the player to move wins
+        sign = 1 if self.player == 'W' else -1
+        score = None
+        if self.placed >= 12:
+            # Also ends the game when the last move left the player to move with two pieces or none to move
+            outcome = self.outcome()
+            if outcome:
+                score = outcome * sign * color * (WIN_SCORE - ply)
+        if score is None and depth == 0:
+            self.leaf_evaluations += 1
+            score = color * self.evaluate()
+            if abs(score) == WIN_SCORE:
+                score -= ply if score > 0 else -ply
+        if score is not None:
+            if tt is not None:
+                tt.store(key, depth, TranspositionTable.EXACT, to_tt_score(score, ply), None)
+            return score, None
+
+        moves = self.legal_moves()
+        if ply == 0 and self.placed < 12:
+            # Symmetric placements are common early on and need searching only once
+            moves = self.unique_moves(moves)
+        if first_move is not None:
+            tt_move = first_move
+        if self.ordering:
+            moves = self.order_moves(moves, tt_move, ply)
+
+        self.interior_nodes += 1
+        alpha_start = alpha
+        best_score = None
+        best_move = None
+        for i, move in enumerate(moves):
+            record = self.make_move(move)
+            if i == 0:
+                score = -self._search(depth - 1, -beta, -alpha, -color, ply=ply + 1)[0]
+            else:
+                # Prove the move no better than the best so far with a null window,
+                # and search it properly only if that fails
+                score = -self._search(depth - 1, -alpha - 1, -alpha, -color, ply=ply + 1)[0]
+                if alpha < score < beta:
+                    score = -self._search(depth - 1, -beta, -score, -color, ply=ply + 1)[0]
+            self.unmake_move(record)
+            if best_score is None or score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.cutoffs += 1
+                self.cutoffs_by_ply[ply] += 1
+                if i == 0:
+                    self.first_move_cutoffs += 1
+                if move.removed is None:
+                    killers = self.killers[ply]
+                    if killers[0] is not move:
+                        killers[0], killers[1] = move, killers[0]
+                    history = self.history_scores[self.player]
+                    history[move] = history.get(move, 0) + depth * depth
+                break
+
+        if best_score is None:
+            # No moves: the player to move loses
+            best_score = -sign * color * (WIN_SCORE - ply)
+        if tt is not None:
+            if best_score <= alpha_start:
+                flag = TranspositionTable.UPPER
+            elif best_score >= beta:
+                flag = TranspositionTable.LOWER
+            else:
+                flag = TranspositionTable.EXACT
+            tt.store(key, depth, flag, to_tt_score(best_score, ply),
+                     best_move and transform_move(best_move, symmetry))
+        return best_score, best_move
+
+    def order_moves(self, moves, tt_move=None, ply=0):
+        """
+        Sorts moves for the search using the enabled heuristics: the
+        transposition table move first, then moves forming a mill, moves
+        blocking an opponent's mill and the killer moves of this ply, then
+        the rest by history score. Ties keep the generator order.
+        """
+        ordering = self.ordering
+        if 'tt' not in ordering:
+            tt_move = None
+        mills = 'mills' in ordering
+        blocks = 0
+        if mills:
+            own = self.position.mask(self.player)
+            opponent = self.position.mask('B' if self.player == 'W' else 'W')
+            for mill in MILL_MASKS:
+                if POPCOUNT[mill & opponent] == 2 and not mill & own:
+                    blocks |= mill & ~opponent
+        killers = self.killers[ply] if 'killers' in ordering and ply < len(self.killers) else ()
+        history = self.history_scores[self.player] if 'history' in ordering else {}
+
+        def priority(move):
+            if move is tt_move:
+                tier = 4
+            elif mills and move.removed is not None:
+                tier = 3
+            elif blocks >> move.dst & 1:
+                tier = 2
+            elif move in killers:
+                tier = 1
+            else:
+                tier = 0
+            return tier, history.get(move, 0)
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def computer_move(self, depth=None, time_ms=None):
+        """
+        Makes a move for the computer based on the priority list.
+        Searches to a fixed depth, or with iterative deepening when time_ms is
+        given or the search can be cancelled (depth then caps the deepening).
+        Returns the depth searched, 0 when a priority rule chose the move
+        without searching, and leaves the search_stats of the move, with its
+        principal variation, in last_search.
+        """
+        if depth is None and time_ms is None:
+            raise ValueError("computer_move needs a depth or a time budget")
+        self.reset_stats()
+        self.last_search = self.search_stats(0)
+        opponent = 'B' if self.player == 'W' else 'W'
+
+        # 0. Play perfectly once the tablebase covers the position
+        if self.tablebase is not None:
+            result = self.tablebase_move(self.player == 'W')
+            if result is not None:
+                print("Computer plays from the tablebase.")
+                self.play(result[1].to_tuple() if result[1] else None)
+                return 0
         
         # 1. Form a mill
-        # Placement Phase
-        if self.placed < 12:
-            for y in range(5):
-                for x in range(5):
-                    if (x,y) in self.adjacent and self.board[y][x] == '*':
-                        self.board[y][x] = self.player
-                        if self.check_mill(x, y, self.player):
-                            self.board[y][x] = '*' # Revert change
-                            self.place(x, y)
-                            print(f"Computer places at ({x}, {y}) to form a mill.")
-                            # Remove piece
-                            self.remove_best_opponent_piece(depth)
-                            return
-                        self.board[y][x] = '*' # Revert
-        # Movement Phase
-        else:
-            for y in range(5):
-                for x in range(5):
-                    if self.board[y][x] == self.player:
-                        # Fly rule
-                        if self.get_piece_count(self.player) == 3:
-                            for ny in range(5):
-                                for nx in range(5):
-                                    if (nx, ny) in self.adjacent and self.board[ny][nx] == '*':
-                                        self.board[ny][nx] = self.player
-                                        self.board[y][x] = '*'
-                                        if self.check_mill(nx, ny, self.player):
-                                            self.board[ny][nx] = '*'
-                                            self.board[y][x] = self.player # Revert
-                                            self.move(x, y, nx, ny)
-                                            print(f"Computer moves from ({x}, {y}) to ({nx}, {ny}) to form a mill.")
-                                            self.remove_best_opponent_piece(depth)
-                                            return
-                                        self.board[ny][nx] = '*'
-                                        self.board[y][x] = self.player # Revert
-                        # Normal move
-                        else:
-                            for nx, ny in self.adjacent.get((x, y), []):
-                                if self.board[ny][nx] == '*':
-                                    self.board[ny][nx] = self.player
-                                    self.board[y][x] = '*'
-                                    if self.check_mill(nx, ny, self.player):
-                                        self.board[ny][nx] = '*'
-                                        self.board[y][x] = self.player # Revert
-                                        self.move(x, y, nx, ny)
-                                        print(f"Computer moves from ({x}, {y}) to ({nx}, {ny}) to form a mill.")
-                                        self.remove_best_opponent_piece(depth)
-                                        return
-                                    self.board[ny][nx] = '*'
-                                    self.board[y][x] = self.player # Revert
+        for move in self.legal_moves(removals=False):
+            if self.forms_mill(move):
+                x, y = POINTS[move.dst]
+                # Placement Phase
+                if move.src is None:
+                    self.place(x, y)
+                    print(f"Computer places at ({x}, {y}) to form a mill.")
+                # Movement Phase
+                else:
+                    x_s, y_s = POINTS[move.src]
+                    self.move(x_s, y_s, x, y)
+                    print(f"Computer moves from ({x_s}, {y_s}) to ({x}, {y}) to form a mill.")
+                # Remove piece
+                return self.remove_best_opponent_piece(depth, time_ms)
         
         # 2. Block opponent's mill
-        # Placement Phase
-        if self.placed < 12:
-            for line in self.lines:
-                opponent_pieces = 0
-                empty_spot = None
-                for x, y in line:
-                    if self.board[y][x] == opponent:
-                        opponent_pieces += 1
-                    elif self.board[y][x] == '*':
-                        empty_spot = (x, y)
-                if opponent_pieces == 2 and empty_spot:
-                    self.place(empty_spot[0], empty_spot[1])
-                    print(f"Computer places at {empty_spot} to block opponent's mill.")
-                    return
-        # Movement Phase
-        else:
-            for line in self.lines:
-                opponent_pieces = 0
-                empty_spot = None
-                for x, y in line:
-                    if self.board[y][x] == opponent:
-                        opponent_pieces += 1
-                    elif self.board[y][x] == '*':
-                        empty_spot = (x, y)
-                if opponent_pieces == 2 and empty_spot:
-                    # Find a piece to move to the blocking spot
-                    for y_s in range(5):
-                        for x_s in range(5):
-                            if self.board[y_s][x_s] == self.player:
-                                if self.get_piece_count(self.player) == 3 or empty_spot in self.adjacent.get((x_s, y_s), []):
-                                    self.move(x_s, y_s, empty_spot[0], empty_spot[1])
-                                    print(f"Computer moves from ({x_s}, {y_s}) to {empty_spot} to block opponent's mill.")
-                                    return
+        empty = self.position.empty()
+        opp = self.position.mask(opponent)
+        for line in MILL_MASKS:
+            if POPCOUNT[line & opp] == 2 and line & empty:
+                spot = (line & empty).bit_length() - 1
+                empty_spot = POINTS[spot]
+                # Find a placement, or a piece to move, to the blocking spot
+                for move in self.legal_moves(removals=False):
+                    if move.dst == spot:
+                        if move.src is None:
+                            self.place(empty_spot[0], empty_spot[1])
+                            print(f"Computer places at {empty_spot} to block opponent's mill.")
+                        else:
+                            x_s, y_s = POINTS[move.src]
+                            self.move(x_s, y_s, empty_spot[0], empty_spot[1])
+                            print(f"Computer moves from ({x_s}, {y_s}) to {empty_spot} to block opponent's mill.")
+                        return 0
 
         # 3. Use minimax
         print("Computer is thinking...")
         maximizing = self.player == 'W'
-        _, best_move = self.minimax(depth, -math.inf, math.inf, maximizing)
+        if time_ms is None and self.cancel is not None:
+            # Deepen up to the depth instead, so a cancelled search has a move to play
+            time_ms = math.inf
+        if time_ms is None and self.parallel is not None:
+            _, best_move = self.parallel.minimax(self, depth, maximizing)
+            self.nodes += self.parallel.nodes
+        elif time_ms is None:
+            self.search_depth, self.best_so_far = depth, None
+            _, best_move = self.minimax(depth, -math.inf, math.inf, maximizing)
+        else:
+            _, best_move, depth = self.iterative_deepening(time_ms, maximizing, depth)
+            print(f"Computer searched to depth {depth}.")
+
+        self.last_search = self.search_stats(depth, self.principal_variation(maximizing, depth, best_move)
+                                             if best_move else [])
+        self.play(best_move)
+        return depth
 
+    def play(self, best_move):
+        """Carry out a move in the format minimax returns, with history and messages"""
         if best_move:
             move_type, pos1, pos2, pos3 = best_move[0], best_move[1], None, None
             if len(best_move) > 2: pos2 = best_move[2]
@@ -685,56 +1153,72 @@ class Game:
         else:
             print("Computer has no moves.")
     
-    def remove_best_opponent_piece(self, depth):
+    def remove_best_opponent_piece(self, depth=None, time_ms=None):
         """
         Determines the best opponent piece to remove.
         1. From an opponent's 2-in-a-row.
         2. Use minimax if no 2-in-a-row exists.
         """
+        self.reset_stats()
+        self.last_search = self.search_stats(0)
         opponent = 'B' if self.player == 'W' else 'W'
         
-        # Check for opponent's 2-in-a-rows
-        for line in self.lines:
-            opponent_pieces = []
-            player_pieces = 0
-            for x, y in line:
-                if self.board[y][x] == opponent:
-                    opponent_pieces.append((x, y))
-                elif self.board[y][x] == self.player:
-                    player_pieces += 1
-            
-            if len(opponent_pieces) == 2 and player_pieces == 0:
+        # Check for opponent's 2-in-a-rows, unless the tablebase will score every removal exactly
+        opp = self.position.mask(opponent)
+        own = self.position.mask(self.player)
+        # (covers only looks at the piece counts after removing one of the opponent's pieces)
+        exact = self.tablebase is not None and self.tablebase.covers(opp & opp - 1, own, self.placed)
+        for line in MILL_MASKS if not exact else []:
+            if POPCOUNT[line & opp] == 2 and not line & own:
                 # Found a 2-in-a-row to break
-                for x_r, y_r in opponent_pieces:
+                for x_r, y_r in (POINTS[i] for i in bits(line & opp)):
                     if self.remove_piece(x_r, y_r, self.player):
                         print(f"Computer removes opponent's piece at ({x_r}, {y_r}) from a 2-in-a-row.")
-                        return
+                        return 0
 
         # If no 2-in-a-row, use minimax to find best removal
-        best_removal = None
-        best_score = -math.inf if self.player == 'W' else math.inf
-        
         removable_pieces = self.get_opponent_pieces(self.player)
         if not removable_pieces:
             print("No pieces to remove.")
-            return
+            return 0
 
-        for x_r, y_r in removable_pieces:
-            temp_game = copy.deepcopy(self)
-            temp_game.remove_piece(x_r, y_r, self.player)
-            temp_game.switch()
-            score, _ = temp_game.minimax(depth - 1, -math.inf, math.inf, self.player == 'B')
-            
-            if self.player == 'W':
-                if score > best_score:
-                    best_score = score
-                    best_removal = (x_r, y_r)
-            else:
-                if score < best_score:
-                    best_score = score
-                    best_removal = (x_r, y_r)
+        def search(depth):
+            best_removal = None
+            best_score = -math.inf if self.player == 'W' else math.inf
+            for x_r, y_r in removable_pieces:
+                record = self.make_move(REMOVALS[INDEX[(x_r, y_r)]])
+                score, _ = self.minimax(depth - 1, -math.inf, math.inf, self.player == 'W')
+                self.unmake_move(record)
+                
+                if self.player == 'W':
+                    if score > best_score:
+                        best_score = score
+                        best_removal = (x_r, y_r)
+                else:
+                    if score < best_score:
+                        best_score = score
+                        best_removal = (x_r, y_r)
+            if best_removal:
+                # Try it first in the next iteration
+                removable_pieces.remove(best_removal)
+                removable_pieces.insert(0, best_removal)
+            return best_score, best_removal
+
+        if time_ms is None and self.cancel is not None:
+            time_ms = math.inf
+        if time_ms is None:
+            self.search_depth, self.best_so_far = depth, None
+            _, best_removal = search(depth)
+        else:
+            (_, best_removal), depth = self._deepen(search, time_ms, depth)
+            print(f"Computer searched to depth {depth}.")
         
         if best_removal:
+            # The line expected after the removal, with the removal as its point
+            record = self.make_move(REMOVALS[INDEX[best_removal]])
+            pv = [best_removal] + self.principal_variation(self.player == 'W', depth - 1)
+            self.unmake_move(record)
+            self.last_search = self.search_stats(depth, pv)
             self.remove_piece(best_removal[0], best_removal[1], self.player)
             print(f"Computer removes opponent's piece at {best_removal} based on minimax.")
         else:
@@ -742,6 +1226,646 @@ class Game:
             x_r, y_r = removable_pieces[0]
             self.remove_piece(x_r, y_r, self.player)
             print(f"Computer removes opponent's piece at ({x_r}, {y_r}).")
+        return depth
+
+
+# Bitboard tables. Point i of the board is bit i of a 16-bit mask, numbered in
+# Game.adjacent order (row by row, left to right), so iterating set bits from
+# the lowest up visits points in the same order as a y-then-x grid scan.
+POINTS = list(Game.adjacent)
+INDEX = {point: i for i, point in enumerate(POINTS)}
+FULL = (1 << len(POINTS)) - 1
+
+
+def to_mask(points):
+    """Build a mask from a list of (x, y) coordinates"""
+    mask = 0
+    for point in points:
+        mask |= 1 << INDEX[point]
+    return mask
+
+
+def bits(mask):
+    """Yield the indexes of the set bits of a mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+ADJACENT_LISTS = [[INDEX[p] for p in Game.adjacent[point]] for point in POINTS]
+ADJACENT_MASKS = [to_mask(Game.adjacent[point]) for point in POINTS]
+MILL_MASKS = [to_mask(line) for line in Game.lines]
+POINT_MILLS = [[mill for mill in MILL_MASKS if mill >> i & 1] for i in range(len(POINTS))]
+POPCOUNT = [bin(mask).count('1') for mask in range(FULL + 1)]
+
+# Text of the points for to_notation: SPREAD moves bit i of a byte to bit 2i, so that
+# SPREAD[white] | SPREAD[black] << 1 holds each point as two bits (0 empty, 1 W, 2 B)
+# and every byte of that is four points of text
+SPREAD = [sum((byte >> i & 1) << 2 * i for i in range(8)) for byte in range(256)]
+# (3, both players on a point, cannot happen)
+POINTS_TEXT = [''.join('.WB?'[byte >> 2 * i & 3] for i in range(4)) for byte in range(256)]
+# Four points of text back to the (white, black) bits they stand for
+POINTS_BITS = {
+    text: (sum(1 << i for i, c in enumerate(text) if c == 'W'), sum(1 << i for i, c in enumerate(text) if c == 'B'))
+    for text in map(''.join, itertools.product('.WB', repeat=4))
+}
+
+
+def encode_points(white, black):
+    """The 16 characters of a position's points, as in Game.to_notation"""
+    code = (SPREAD[white & 255] | SPREAD[white >> 8] << 16) | (SPREAD[black & 255] | SPREAD[black >> 8] << 16) << 1
+    return (POINTS_TEXT[code & 255] + POINTS_TEXT[code >> 8 & 255]
+            + POINTS_TEXT[code >> 16 & 255] + POINTS_TEXT[code >> 24])
+
+
+def decode_points(text):
+    """(white, black) masks of the 16 characters from encode_points; ValueError if malformed"""
+    try:
+        white = black = 0
+        for shift in (0, 4, 8, 12):
+            w, b = POINTS_BITS[text[shift:shift + 4]]
+            white |= w << shift
+            black |= b << shift
+    except KeyError:
+        raise ValueError(f"Bad position notation: {text!r}") from None
+    if len(text) != 16:
+        raise ValueError(f"Bad position notation: {text!r}")
+    return white, black
+
+
+def pack_position(white, black, player, placed):
+    """
+    A position in 5 bytes: White's and Black's 16-bit masks, little-endian,
+    then the pieces placed in the low bits of the last byte and the top bit
+    set when Black is to move
+    """
+    return bytes((white & 255, white >> 8, black & 255, black >> 8, placed | (player == 'B') << 7))
+
+
+def unpack_position(data):
+    """(white, black, player, placed) of a position from pack_position"""
+    if len(data) != 5:
+        raise ValueError(f"A packed position is 5 bytes, not {len(data)}")
+    return data[0] | data[1] << 8, data[2] | data[3] << 8, 'B' if data[4] & 128 else 'W', data[4] & 127
+
+
+def _build_symmetries():
+    # The board looks the same after rotating or reflecting it, and after
+    # swapping the inner and outer squares (coordinates 0 <-> 1 and 3 <-> 4).
+    # Their combinations give 16 permutations of the points, identity first.
+    swap = {0: 1, 1: 0, 2: 2, 3: 4, 4: 3}
+    generators = [
+        [INDEX[(4 - y, x)] for x, y in POINTS],
+        [INDEX[(4 - x, y)] for x, y in POINTS],
+        [INDEX[(swap[x], swap[y])] for x, y in POINTS],
+    ]
+    identity = tuple(range(len(POINTS)))
+    found = {identity}
+    frontier = [identity]
+    while frontier:
+        perm = frontier.pop()
+        for generator in generators:
+            composed = tuple(generator[i] for i in perm)
+            if composed not in found:
+                found.add(composed)
+                frontier.append(composed)
+    symmetries = sorted(found)
+    mills = set(MILL_MASKS)
+    for perm in symmetries:
+        for i, j in zip(perm, range(len(POINTS))):
+            assert ADJACENT_MASKS[i] == sum(1 << perm[k] for k in bits(ADJACENT_MASKS[j]))
+        assert {sum(1 << perm[k] for k in bits(mill)) for mill in mills} == mills
+    return symmetries
+
+
+# SYMMETRIES[s][i] is the point that point i maps to under symmetry s
+SYMMETRIES = _build_symmetries()
+# Each symmetry as two 256-entry tables, one per byte of a mask
+SYMMETRY_TABLES = [
+    ([sum(1 << perm[i] for i in bits(low)) for low in range(256)],
+     [sum(1 << perm[i + 8] for i in bits(high)) for high in range(256)])
+    for perm in SYMMETRIES
+]
+
+
+def transform(mask, symmetry):
+    """Image of a mask of points under one of the SYMMETRIES"""
+    low, high = SYMMETRY_TABLES[symmetry]
+    return low[mask & 255] | high[mask >> 8]
+
+
+def _build_canonical():
+    # CANONICAL_MASK[mask] is the smallest image of mask under the symmetries
+    # and CANONICAL_SYMMETRIES[mask] the symmetries that map mask to it
+    images = zip(*([low[mask & 255] | high[mask >> 8] for mask in range(FULL + 1)]
+                   for low, high in SYMMETRY_TABLES))
+    single = [(s,) for s in range(len(SYMMETRIES))]
+    canonical_mask = []
+    canonical_symmetries = []
+    for column in images:
+        smallest = min(column)
+        canonical_mask.append(smallest)
+        if column.count(smallest) == 1:
+            canonical_symmetries.append(single[column.index(smallest)])
+        else:
+            canonical_symmetries.append(tuple(s for s, image in enumerate(column) if image == smallest))
+    return canonical_mask, canonical_symmetries
+
+
+CANONICAL_MASK, CANONICAL_SYMMETRIES = _build_canonical()
+INVERSE_SYMMETRIES = [SYMMETRIES.index(tuple(sorted(range(len(POINTS)), key=perm.__getitem__)))
+                      for perm in SYMMETRIES]
+
+
+def canonical_form(first, second):
+    """
+    The smallest image of a pair of masks under the symmetries, comparing
+    first then second, as (symmetry, first image, second image)
+    """
+    symmetries = CANONICAL_SYMMETRIES[first]
+    symmetry = symmetries[0]
+    image = transform(second, symmetry)
+    for other in symmetries[1:]:
+        other_image = transform(second, other)
+        if other_image < image:
+            symmetry, image = other, other_image
+    return symmetry, CANONICAL_MASK[first], image
+
+
+# Zobrist keys for the pieces, placed count and side to move. The fixed seed keeps
+# keys stable between runs so hashes can be compared across processes.
+_zobrist_random = random.Random(0x6D6D)
+ZOBRIST_WHITE = [_zobrist_random.getrandbits(64) for _ in POINTS]
+ZOBRIST_BLACK = [_zobrist_random.getrandbits(64) for _ in POINTS]
+ZOBRIST_PLACED = [_zobrist_random.getrandbits(64) for _ in range(13)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+# Mixed into transposition table keys, since /minimax lets callers pick the maximizing side
+ZOBRIST_MAXIMIZING = _zobrist_random.getrandbits(64)
+
+
+def _zobrist_bytes(keys):
+    # XOR of the keys of the points set in each value of the low and the high byte of a mask
+    tables = ([0] * 256, [0] * 256)
+    for byte in range(256):
+        for i in bits(byte):
+            tables[0][byte] ^= keys[i]
+            tables[1][byte] ^= keys[i + 8]
+    return tables
+
+
+ZOBRIST_WHITE_BYTES = _zobrist_bytes(ZOBRIST_WHITE)
+ZOBRIST_BLACK_BYTES = _zobrist_bytes(ZOBRIST_BLACK)
+
+
+MAX_SEARCH_DEPTH = 64
+# Seconds between the progress reports of a search
+PROGRESS_INTERVAL = 0.25
+# Move ordering heuristics, see Game.order_moves
+MOVE_ORDERING = ('tt', 'mills', 'killers', 'history')
+# Score of a win, less one per ply to the end; heuristic scores stay far below it
+WIN_SCORE = 10000
+# Scores beyond this are forced wins or losses
+WIN_THRESHOLD = WIN_SCORE - 1000
+# Half-width of the window around the previous iteration's score in iterative deepening
+ASPIRATION_WINDOW = 15
+# Tablebase loaded at startup by the console game and the web server, when it exists
+TABLEBASE_PATH = os.environ.get("MORRIS_TABLEBASE", "tablebase.bin")
+# Entries of undo history kept per game, at least 1
+HISTORY_SIZE = int(os.environ.get("MORRIS_HISTORY_SIZE", 256))
+if HISTORY_SIZE < 1:
+    raise ValueError(f"MORRIS_HISTORY_SIZE must be at least 1, not {HISTORY_SIZE}")
+# Check Game's incrementally kept evaluation terms against a full recount at every
+# evaluation, for debugging (slow)
+CHECK_INCREMENTAL = os.environ.get("MORRIS_CHECK_INCREMENTAL", "") not in ("", "0")
+
+
+def to_tt_score(score, ply):
+    """Turn a win score counted from the search root into one counted from the node, for storing"""
+    if score >= WIN_THRESHOLD:
+        return score + ply
+    if score <= -WIN_THRESHOLD:
+        return score - ply
+    return score
+
+
+def from_tt_score(score, ply):
+    """Inverse of to_tt_score"""
+    if score >= WIN_THRESHOLD:
+        return score - ply
+    if score <= -WIN_THRESHOLD:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the iterative deepening deadline passes or the search is cancelled"""
+
+
+def in_mill(mask, i):
+    """Check if the piece at point i is part of a mill within mask"""
+    for mill in POINT_MILLS[i]:
+        if mask & mill == mill:
+            return True
+    return False
+
+
+def removable_mask(mask):
+    """Pieces of mask the opponent may remove: those outside mills, or all if every piece is in one"""
+    milled = 0
+    for mill in MILL_MASKS:
+        if mask & mill == mill:
+            milled |= mill
+    free = mask & ~milled
+    return free if free else mask
+
+
+def occupy_terms(i, own, other):
+    """
+    Changes to the incremental evaluation terms (see Game.recount) when the
+    owner of own takes the empty point i, own and other not including it:
+    (own two-in-a-rows, the other's two-in-a-rows, own mobility, the other's
+    mobility). Emptying the point again takes them back.
+    """
+    own_twos = other_twos = 0
+    for mill in POINT_MILLS[i]:
+        if not mill & other:
+            count = POPCOUNT[mill & own]
+            if count == 1:
+                own_twos += 1
+            elif count == 2:
+                # The two becomes a full line
+                own_twos -= 1
+        elif not mill & own and POPCOUNT[mill & other] == 2:
+            # Blocks the other's two
+            other_twos -= 1
+    adjacent = ADJACENT_MASKS[i]
+    # The piece steps to the empty neighbours, and neighbours lose their step to i
+    return (own_twos, other_twos, POPCOUNT[adjacent & ~(own | other)] - POPCOUNT[adjacent & own],
+            -POPCOUNT[adjacent & other])
+
+
+# Game.terms packs the four incremental evaluation terms into one int, TERM_BITS
+# each. Every term stays between 0 and TERM_MASK, so packed changes add up even
+# when some of them are negative.
+TERM_BITS = 8
+TERM_MASK = (1 << TERM_BITS) - 1
+WHITE_TWOS, BLACK_TWOS, WHITE_MOBILITY, BLACK_MOBILITY = (n * TERM_BITS for n in range(4))
+
+
+def pack_terms(white_twos, black_twos, white_mobility, black_mobility):
+    """The terms, or changes to them, packed into one int"""
+    return (white_twos << WHITE_TWOS) + (black_twos << BLACK_TWOS) \
+        + (white_mobility << WHITE_MOBILITY) + (black_mobility << BLACK_MOBILITY)
+
+
+def unpack_terms(terms):
+    """(white_twos, black_twos, white_mobility, black_mobility) of packed terms"""
+    return tuple(terms >> shift & TERM_MASK for shift in (WHITE_TWOS, BLACK_TWOS, WHITE_MOBILITY, BLACK_MOBILITY))
+
+
+def _build_term_tables():
+    # A point's occupy_terms only depend on the points on its lines and its neighbours,
+    # so tabulate them, packed, for every way of filling those. The tables are keyed
+    # by white & region | (black & region) << 16.
+    regions, white_tables, black_tables = [], [], []
+    for i in range(len(POINTS)):
+        region = ADJACENT_MASKS[i]
+        for mill in POINT_MILLS[i]:
+            region |= mill & ~(1 << i)
+        white_table, black_table = {}, {}
+        others = list(bits(region))
+        for fill in itertools.product((0, 1, 2), repeat=len(others)):
+            white = sum(1 << j for j, piece in zip(others, fill) if piece == 1)
+            black = sum(1 << j for j, piece in zip(others, fill) if piece == 2)
+            own_twos, other_twos, own_mobility, other_mobility = occupy_terms(i, white, black)
+            white_table[white | black << 16] = pack_terms(own_twos, other_twos, own_mobility, other_mobility)
+            own_twos, other_twos, own_mobility, other_mobility = occupy_terms(i, black, white)
+            black_table[white | black << 16] = pack_terms(other_twos, own_twos, other_mobility, own_mobility)
+        regions.append(region)
+        white_tables.append(white_table)
+        black_tables.append(black_table)
+    return regions, white_tables, black_tables
+
+
+TERM_REGIONS, WHITE_TERMS, BLACK_TERMS = _build_term_tables()
+
+
+# Game.history entries are 16-bit: the source point + 1 in bits 0-4 (0 for a placement),
+# the destination (or the point a piece was removed from) in bits 5-8, bit 9 set for a
+# black piece and bit 10 for a removal
+HISTORY_BLACK = 1 << 9
+HISTORY_REMOVAL = 1 << 10
+
+
+def history_entry(src, dst, player, removal=False):
+    """A history entry for a placement (src None), movement or, with removal, the removal of player's piece at dst"""
+    return ((0 if src is None else src + 1) | dst << 5 | (HISTORY_BLACK if player == 'B' else 0)
+            | (HISTORY_REMOVAL if removal else 0))
+
+
+def read_history_entry(entry):
+    """(src, dst, player, removal) of a history entry"""
+    src = (entry & 31) - 1
+    return (None if src < 0 else src, entry >> 5 & 15, 'B' if entry & HISTORY_BLACK else 'W',
+            bool(entry & HISTORY_REMOVAL))
+
+
+class Move(namedtuple('Move', ['kind', 'src', 'dst', 'removed'])):
+    """
+    A move in point indexes. kind is 'place', 'move' (to an adjacent point),
+    'fly' or 'remove' (a bare removal finishing a move already played). src
+    is None for placements and removals, dst is None for removals and
+    removed is None when no piece is taken.
+
+    Every possible move is built once at import; use get_move or the tables
+    instead of constructing new ones.
+    """
+
+    __slots__ = ()
+
+    def to_tuple(self):
+        """The ('place', (x, y), removed) / ('move', (x, y), (nx, ny), removed) form minimax returns"""
+        removed = POINTS[self.removed] if self.removed is not None else None
+        if self.src is None:
+            return ('place', POINTS[self.dst], removed)
+        return ('move', POINTS[self.src], POINTS[self.dst], removed)
+
+    @staticmethod
+    def from_tuple(move):
+        """Inverse of to_tuple"""
+        removed = INDEX[move[-1]] if move[-1] is not None else None
+        if move[0] == 'place':
+            return get_move(None, INDEX[move[1]], removed)
+        return get_move(INDEX[move[1]], INDEX[move[2]], removed)
+
+
+def _build_moves():
+    # MOVES[src + 1][dst][removed + 1], with row 0 for placements and column 0 for no removal
+    table = []
+    for src in [None] + list(range(len(POINTS))):
+        row = []
+        for dst in range(len(POINTS)):
+            if src is None:
+                kind = 'place'
+            elif ADJACENT_MASKS[src] >> dst & 1:
+                kind = 'move'
+            else:
+                kind = 'fly'
+            row.append([Move(kind, src, dst, removed) for removed in [None] + list(range(len(POINTS)))])
+        table.append(row)
+    return table
+
+
+MOVES = _build_moves()
+REMOVALS = [Move('remove', None, None, i) for i in range(len(POINTS))]
+
+
+def get_move(src, dst, removed=None):
+    """Look up the interned Move; src None is a placement, dst None a bare removal"""
+    if dst is None:
+        return REMOVALS[removed]
+    return MOVES[0 if src is None else src + 1][dst][0 if removed is None else removed + 1]
+
+
+def transform_move(move, symmetry):
+    """Image of a Move under one of the SYMMETRIES"""
+    perm = SYMMETRIES[symmetry]
+    kind, src, dst, removed = move
+    return get_move(None if src is None else perm[src], None if dst is None else perm[dst],
+                    None if removed is None else perm[removed])
+
+
+def legal_moves(own, opponent, placing, removals=True):
+    """
+    Yields every legal move for the player owning the pieces in own, in the
+    order the search tries them: points in grid scan order, steps in
+    Game.adjacent order, and one move per removable opponent piece when a
+    mill is formed (or a single move without removal if nothing can be taken).
+    Does not check for a finished game.
+    """
+    empty = FULL ^ (own | opponent)
+    taken = None
+    # Placement Phase
+    if placing:
+        row = MOVES[0]
+        for dst in bits(empty):
+            moves = row[dst]
+            if removals and in_mill(own | 1 << dst, dst):
+                if taken is None:
+                    taken = [i + 1 for i in bits(removable_mask(opponent))] or [0]
+                for r in taken:
+                    yield moves[r]
+            else:
+                yield moves[0]
+    # Movement Phase
+    else:
+        # Fly rule
+        flying = POPCOUNT[own] <= 3
+        for src in bits(own):
+            row = MOVES[src + 1]
+            rest = own ^ 1 << src
+            for dst in (bits(empty) if flying else ADJACENT_LISTS[src]):
+                if not empty >> dst & 1:
+                    continue
+                moves = row[dst]
+                if removals and in_mill(rest | 1 << dst, dst):
+                    if taken is None:
+                        taken = [i + 1 for i in bits(removable_mask(opponent))] or [0]
+                    for r in taken:
+                        yield moves[r]
+                else:
+                    yield moves[0]
+
+
+class Position:
+    """Piece placement as two 16-bit masks, one for each player"""
+
+    __slots__ = ('white', 'black')
+
+    def __init__(self, white=0, black=0):
+        self.white = white
+        self.black = black
+
+    @classmethod
+    def from_grid(cls, grid):
+        position = cls()
+        for i, (x, y) in enumerate(POINTS):
+            if grid[y][x] != '*':
+                position.set(i, grid[y][x])
+        return position
+
+    def to_grid(self):
+        grid = [['*' for j in range(5)] for i in range(5)]
+        for i, (x, y) in enumerate(POINTS):
+            grid[y][x] = self.get(i)
+        return grid
+
+    def mask(self, player):
+        if player == 'W':
+            return self.white
+        if player == 'B':
+            return self.black
+        return 0
+
+    def empty(self):
+        return FULL ^ (self.white | self.black)
+
+    def get(self, i):
+        if self.white >> i & 1:
+            return 'W'
+        if self.black >> i & 1:
+            return 'B'
+        return '*'
+
+    def set(self, i, player):
+        if player == 'W':
+            self.white |= 1 << i
+        else:
+            self.black |= 1 << i
+
+    def clear(self, i):
+        self.white &= ~(1 << i)
+        self.black &= ~(1 << i)
+
+    def count(self, player):
+        return POPCOUNT[self.mask(player)]
+
+    def removable(self, player):
+        """Mask of the player's pieces the opponent may remove after forming a mill"""
+        return removable_mask(self.mask(player))
+
+    def two_in_a_rows(self, player):
+        """Count lines holding two of the player's pieces and one empty point"""
+        mask = self.mask(player)
+        empty = self.empty()
+        count = 0
+        for mill in MILL_MASKS:
+            if POPCOUNT[mill & mask] == 2 and mill & empty:
+                count += 1
+        return count
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.white == other.white and self.black == other.black
+
+    def __hash__(self):
+        return hash((self.white, self.black))
+
+    def __repr__(self):
+        return f"Position(white={self.white:#06x}, black={self.black:#06x})"
+
+
+class History:
+    """
+    A game's placements, movements and removals as history entries, in a
+    ring buffer allocated once: the oldest are forgotten beyond size. Undo
+    steps back over a placement or movement and the removals after it, and
+    redo forward again until something new is pushed.
+    """
+
+    __slots__ = ('entries', 'size', 'first', 'length', 'end')
+
+    def __init__(self, size=HISTORY_SIZE):
+        if size < 1:
+            raise ValueError(f"History size must be at least 1, not {size}")
+        self.size = size
+        self.entries = array.array('H', bytes(2 * size))
+        # Ring index of the oldest entry, entries done and entries done or undone
+        self.first = 0
+        self.length = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        """The entries done, oldest first"""
+        for n in range(self.length):
+            yield self.entries[(self.first + n) % self.size]
+
+    def clear(self):
+        self.first = self.length = self.end = 0
+
+    def push(self, entry):
+        """Record an entry, forgetting the undone ones"""
+        if self.length == self.size:
+            self.first = (self.first + 1) % self.size
+            self.length -= 1
+        self.entries[(self.first + self.length) % self.size] = entry
+        self.length += 1
+        self.end = self.length
+
+    def extend(self, entries):
+        for entry in entries:
+            self.push(entry)
+
+    def undo(self):
+        """
+        Step back over the last placement or movement and any removals after
+        it and return their entries, newest first; None if no placement or
+        movement is left
+        """
+        for n in range(self.length - 1, -1, -1):
+            if not self.entries[(self.first + n) % self.size] & HISTORY_REMOVAL:
+                entries = [self.entries[(self.first + m) % self.size] for m in range(self.length - 1, n - 1, -1)]
+                self.length = n
+                return entries
+        return None
+
+    def redo(self):
+        """Step forward over what the last undo took back and return its entries, oldest first; None if nothing"""
+        if self.length == self.end:
+            return None
+        n = self.length + 1
+        while n < self.end and self.entries[(self.first + n) % self.size] & HISTORY_REMOVAL:
+            n += 1
+        entries = [self.entries[(self.first + m) % self.size] for m in range(self.length, n)]
+        self.length = n
+        return entries
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results indexed by the low bits of the Zobrist key.
+    Entries hold the searched depth, bound type, score and best move.
+
+    Replacement policies:
+    - 'depth': keep the deeper entry, but always replace entries from earlier searches
+    - 'always': the newest entry wins
+    """
+
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, size=1 << 16, replacement='depth'):
+        if replacement not in ('depth', 'always'):
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+        # Round down to a power of two so the slot is a mask of the key
+        self.size = 1 << (size.bit_length() - 1)
+        self.mask = self.size - 1
+        self.replacement = replacement
+        self.slots = [None] * self.size
+        self.generation = 0
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        """Return (depth, flag, score, move) for key, or None"""
+        slot = self.slots[key & self.mask]
+        if slot is not None and slot[0] == key:
+            return slot[1:5]
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key & self.mask
+        slot = self.slots[index]
+        if (self.replacement == 'always' or slot is None or slot[0] == key
+                or slot[5] != self.generation or depth >= slot[1]):
+            self.slots[index] = (key, depth, flag, score, move, self.generation)
 
 
 def main():
@@ -762,7 +1886,15 @@ def main():
                 print("Please enter valid numbers")
     
     print("Welcome to the Six Men Morris Solver!")
+    if os.path.exists(TABLEBASE_PATH):
+        Game.load_tablebase(TABLEBASE_PATH)
+        print("Loaded the endgame tablebase.")
     game = Game()
+    # Split the computer's searches over this many processes
+    search_workers = int(os.environ.get("MORRIS_SEARCH_WORKERS", 1))
+    if search_workers > 1:
+        from parallel import ParallelSearch
+        game.parallel = ParallelSearch(search_workers)
     
     while True:
         if not game.game_active:
@@ -852,6 +1984,11 @@ def main():
                         print("Please enter a valid integer for depth.")
                 
                 game.computer_move(depth)
+                stats = game.last_search
+                if stats["depth"]:
+                    factor = stats["branching_factor"]
+                    print(f"Searched {stats['nodes']} nodes in {stats['elapsed_ms']:.0f}ms, "
+                          f"branching factor {'n/a' if factor is None else f'{factor:.1f}'}.")
                 if game.check_win():
                     game.display_board()
                     print(f"{game.player} wins!")
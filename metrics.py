@@ -0,0 +1,79 @@
+"""
+Counters of the web server's searches, in the Prometheus text format.
+
+Every search the server answers is recorded with the search_stats its
+worker returned (Game.search_stats), labelled with the kind of search:
+how many there were, how many came from the result cache, and the nodes,
+leaf evaluations, cutoffs, transposition table hits and time they took,
+with a histogram of search times to spot slow ones.
+
+    metrics = SearchMetrics()
+    metrics.record("computer_move", stats)
+    text = metrics.render()     # served by GET /metrics
+"""
+import math
+from collections import defaultdict
+
+# Upper bounds, in seconds, of the search time histogram's buckets
+TIME_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1, 5, 10, 30, math.inf)
+# Counters summed from search_stats: (metric name, stats key, help text)
+COUNTERS = (
+    ("morris_search_nodes_total", "nodes", "Nodes visited by searches"),
+    ("morris_search_leaf_evaluations_total", "leaf_evaluations", "Positions evaluated at the search horizon"),
+    ("morris_search_cutoffs_total", "cutoffs", "Beta cutoffs in searches"),
+    ("morris_search_tt_hits_total", "tt_hits", "Transposition table entries found by searches"),
+)
+
+
+class SearchMetrics:
+    """Search counters by kind of search, since the server started"""
+
+    def __init__(self):
+        self.searches = defaultdict(int)
+        self.cached = defaultdict(int)
+        self.totals = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.buckets = defaultdict(lambda: [0] * len(TIME_BUCKETS))
+
+    def record(self, kind, stats=None, cached=False):
+        """Count a search of kind with its search_stats; a cached answer has none"""
+        self.searches[kind] += 1
+        if cached:
+            self.cached[kind] += 1
+        if stats is None:
+            return
+        for _, key, _ in COUNTERS:
+            self.totals[kind, key] += stats[key]
+        seconds = stats["elapsed_ms"] / 1000
+        self.seconds[kind] += seconds
+        buckets = self.buckets[kind]
+        for i, bound in enumerate(TIME_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+
+    def render(self):
+        """All counters in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        kinds = sorted(self.searches)
+        metric("morris_searches_total", "counter", "Searches answered",
+               [f'morris_searches_total{{search="{kind}"}} {self.searches[kind]}' for kind in kinds])
+        metric("morris_search_cache_hits_total", "counter", "Searches answered from the result cache",
+               [f'morris_search_cache_hits_total{{search="{kind}"}} {self.cached[kind]}' for kind in kinds])
+        for name, key, help_text in COUNTERS:
+            metric(name, "counter", help_text,
+                   [f'{name}{{search="{kind}"}} {self.totals[kind, key]}' for kind in kinds])
+        samples = []
+        for kind in sorted(self.buckets):
+            for bound, count in zip(TIME_BUCKETS, self.buckets[kind]):
+                le = "+Inf" if bound == math.inf else bound
+                samples.append(f'morris_search_seconds_bucket{{search="{kind}",le="{le}"}} {count}')
+            samples.append(f'morris_search_seconds_sum{{search="{kind}"}} {self.seconds[kind]}')
+            samples.append(f'morris_search_seconds_count{{search="{kind}"}} {self.buckets[kind][-1]}')
+        metric("morris_search_seconds", "histogram", "Time searches took in the worker", samples)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,145 @@
+"""
+Parallel root search.
+
+The moves at the root of a search are split across worker processes, each
+searching the positions they lead to with a Game of its own. The first
+move, in the same order the serial search tries them, is searched with a
+full window to get a bound; the others are then searched in parallel with
+a null window around it, and only those that beat it are searched again for
+their exact score. The best move is the first of the highest score, as in
+the serial search, so both return the same move at the same depth.
+
+    search = ParallelSearch(workers=4)
+    game.parallel = search          # computer_move now searches in parallel
+    score, move = search.minimax(game, 7, True)
+
+The worker count comes from MORRIS_SEARCH_WORKERS by default (one per CPU).
+"""
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from main import (INVERSE_SYMMETRIES, TABLEBASE_PATH, ZOBRIST_MAXIMIZING, Game, transform_move)
+
+WORKERS = int(os.environ.get("MORRIS_SEARCH_WORKERS", os.cpu_count() or 1))
+
+
+class ParallelSearch:
+    """Splits the root moves of Game searches over a lazily started process pool"""
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.executor = None
+        # Nodes searched by the workers in the last search
+        self.nodes = 0
+        self.searches = 0
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def minimax(self, game, depth, maximizing_player):
+        """
+        Like game.minimax(depth, -inf, inf, maximizing_player), returning
+        (score, best_move) with the same move. Positions with one move or
+        none, finished games, tablebase positions and depths below 2 are
+        searched serially.
+        """
+        self.nodes = 0
+        self.searches += 1
+        color = 1 if maximizing_player else -1
+        moves = self.root_moves(game, depth, color)
+        if len(moves) < 2:
+            return game.minimax(depth, -math.inf, math.inf, maximizing_player)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                initargs=(TABLEBASE_PATH,))
+
+        def submit(move, alpha, beta):
+            record = game.make_move(move)
+            state = game.snapshot()
+            game.unmake_move(record)
+            return self.executor.submit(_search_child, self.searches, state, depth - 1, alpha, beta, color)
+
+        # Exact scores, from the side to move's point of view, of the moves that might be best
+        scores = {}
+        scores[0], nodes = submit(moves[0], -math.inf, math.inf).result()
+        self.nodes += nodes
+        bound = scores[0]
+        tests = {submit(move, bound, bound + 1): i for i, move in enumerate(moves) if i}
+        searches = {}
+        while tests or searches:
+            done, _ = wait(list(tests) + list(searches), return_when=FIRST_COMPLETED)
+            for future in done:
+                score, nodes = future.result()
+                self.nodes += nodes
+                if future in tests:
+                    i = tests.pop(future)
+                    if score > bound:
+                        # Better than the first move: find out by how much
+                        searches[submit(moves[i], bound, math.inf)] = i
+                else:
+                    scores[searches.pop(future)] = score
+        best = max(scores.values())
+        i = min(i for i, score in scores.items() if score == best)
+        return color * best, moves[i].to_tuple()
+
+    @staticmethod
+    def root_moves(game, depth, color):
+        """
+        The moves the serial search would try at the root, in its order, or
+        an empty list where it would not search any
+        """
+        if depth < 2:
+            return []
+        if game.tablebase is not None and game.tablebase_move(color > 0) is not None:
+            return []
+        if game.placed >= 12 and (game.check_win() or game.get_piece_count(game.player) <= 2):
+            return []
+        tt_move = None
+        if game.tt is not None:
+            key, symmetry = game.canonical_key()
+            if color > 0:
+                key ^= ZOBRIST_MAXIMIZING
+            entry = game.tt.probe(key)
+            if entry is not None and entry[3] is not None:
+                tt_move = transform_move(entry[3], INVERSE_SYMMETRIES[symmetry])
+        moves = game.legal_moves()
+        if game.placed < 12:
+            moves = game.unique_moves(moves)
+        if game.ordering:
+            while len(game.killers) < depth:
+                game.killers.append([None, None])
+            moves = game.order_moves(moves, tt_move, 0)
+        return list(moves)
+
+
+# The game of the current worker process, and the root search its transposition table is for
+_game = None
+_search = None
+
+
+def _init_worker(tablebase_path):
+    global _game
+    if os.path.exists(tablebase_path):
+        Game.load_tablebase(tablebase_path)
+    _game = Game()
+
+
+def _search_child(search, state, depth, alpha, beta, color):
+    """Score of the position after a root move, for the side to move at the root, and the nodes searched"""
+    global _search
+    game = _game
+    if search != _search and game.tt is not None:
+        # Entries from other searches could give scores from deeper than this one goes
+        game.tt.clear()
+    _search = search
+    game.restore(state)
+    game.nodes = 0
+    while len(game.killers) <= depth:
+        game.killers.append([None, None])
+    while len(game.cutoffs_by_ply) <= depth:
+        game.cutoffs_by_ply.append(0)
+    score = -game._search(depth, -beta, -alpha, -color, ply=1)[0]
+    return score, game.nodes
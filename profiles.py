@@ -0,0 +1,94 @@
+"""
+Profiles of the web server's searches.
+
+A search asked to be profiled (profile=true on the search endpoints, or a
+share MORRIS_PROFILE_RATE of all searches) runs under cProfile in its
+worker process, which sends back the statistics with the result. The
+server keeps the last MORRIS_MAX_PROFILES of them, oldest dropped first,
+and serves them from the admin endpoints, either as a file for pstats or
+snakeviz or as pstats' text report:
+
+    python -m pstats computer_move-abc123.prof
+
+Admin endpoints need MORRIS_ADMIN_TOKEN to be set and sent in the
+X-Admin-Token header. Searches that are not profiled only pay for a check
+of the flag.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import secrets
+import time
+from collections import OrderedDict
+
+PROFILE_RATE = float(os.environ.get("MORRIS_PROFILE_RATE", 0))
+MAX_PROFILES = int(os.environ.get("MORRIS_MAX_PROFILES", 100))
+ADMIN_TOKEN = os.environ.get("MORRIS_ADMIN_TOKEN") or None
+# Orders pstats can sort the text report by
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'filename')
+
+
+def profiled(function, *args, **kwargs):
+    """Call function under cProfile: returns (its result, the statistics as dump_stats writes them)"""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    profiler.create_stats()
+    return result, marshal.dumps(profiler.stats)
+
+
+class Profile:
+    """The cProfile statistics of one search, with what was searched"""
+
+    def __init__(self, profile_id, search, data, **info):
+        self.id = profile_id
+        self.search = search
+        self.data = data
+        self.info = info
+        self.created = time.time()
+
+    def to_dict(self):
+        return {"profile_id": self.id, "search": self.search, "created": self.created, "size": len(self.data),
+                **self.info}
+
+    def filename(self):
+        return f"{self.search}-{self.id}.prof"
+
+    def report(self, sort='cumulative', limit=40):
+        """pstats' text report of the functions that took the most time, limit of them"""
+        stream = io.StringIO()
+        stats = pstats.Stats(stream=stream)
+        stats.stats = marshal.loads(self.data)
+        stats.get_top_level_stats()
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+class ProfileStore:
+    """Profiles by ID, the last max_profiles of them"""
+
+    def __init__(self, max_profiles=MAX_PROFILES, rate=PROFILE_RATE):
+        self.max_profiles = max_profiles
+        self.rate = rate
+        self.profiles = OrderedDict()
+
+    def wanted(self, requested=False):
+        """Whether to profile a search, requested by its client or not"""
+        return requested or (self.rate > 0 and random.random() < self.rate)
+
+    def add(self, search, data, **info):
+        """Keep the statistics of a search of kind search and return its Profile"""
+        profile = Profile(secrets.token_urlsafe(9), search, data, **info)
+        self.profiles[profile.id] = profile
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+        return profile
+
+    def get(self, profile_id):
+        return self.profiles.get(profile_id)
+
+    def __iter__(self):
+        """Newest first"""
+        return reversed(self.profiles.values())
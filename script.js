@@ -1,5 +1,17 @@
 class SixMensMorrisUI {
     constructor() {
+        // ID of this page's game on the server, sent with every request
+        this.gameId = null;
+        // Last /state snapshot's board and version (its ETag)
+        this.board = null;
+        this.stateVersion = null;
+        this.lastState = null;
+        // WebSocket pushing the game's changes and the computer's search progress
+        this.socket = null;
+        this.pushedState = null;
+        this.thinking = false;
+        // Moves sent from this page and not answered yet
+        this.requests = 0;
         this.selectedPosition = null;
         this.gameState = {
             currentPlayer: 'W',
@@ -51,10 +63,8 @@ class SixMensMorrisUI {
 
     async startNewGame() {
         try {
-            await fetch('/start', { method: 'POST' });
-            this.gameState.gameActive = true; // Set game as active
+            await this.start();
             this.gameState.victor = null; // Reset victor state
-            await this.updateGameState();
             this.selectedPosition = null;
             
             // Hide welcome screen and show game
@@ -74,10 +84,8 @@ class SixMensMorrisUI {
 
     async restartGame() {
         try {
-            await fetch('/start', { method: 'POST' });
-            this.gameState.gameActive = true;
+            await this.start();
             this.gameState.victor = null; // Reset victor state
-            await this.updateGameState();
             this.selectedPosition = null;
             
             // Re-render the board completely
@@ -92,43 +100,45 @@ class SixMensMorrisUI {
 
     async updateGameState() {
         try {
-            // Get current player and piece counts
-            const [whiteCount, blackCount, whiteRemoved, blackRemoved, currentPlayer, placedCount, gameActive] = await Promise.all([
-                this.getPieceCount('W'),
-                this.getPieceCount('B'),
-                this.getRemovedCount('W'),
-                this.getRemovedCount('B'),
-                this.getCurrentPlayer(),
-                this.getPlacedCount(),
-                this.getGameActive()
-            ]);
-            
-            this.gameState.whiteCount = whiteCount;
-            this.gameState.blackCount = blackCount;
-            this.gameState.whiteRemoved = whiteRemoved;
-            this.gameState.blackRemoved = blackRemoved;
-            this.gameState.placed = placedCount;
-            this.gameState.currentPlayer = currentPlayer;
-            this.gameState.gameActive = gameActive;
-            this.gameState.phase = this.gameState.placed < 12 ? 'placement' : 'movement';
-            
-            // Update UI elements
-            document.getElementById('white-count').textContent = whiteCount;
-            document.getElementById('black-count').textContent = blackCount;
-            document.getElementById('white-removed').textContent = whiteRemoved;
-            document.getElementById('black-removed').textContent = blackRemoved;
-            document.getElementById('current-player').textContent = 
-                `Current Player: ${this.gameState.currentPlayer === 'W' ? 'White' : 'Black'}`;
-            document.getElementById('game-phase').textContent = 
-                `Phase: ${this.gameState.phase === 'placement' ? 'Placement' : 'Movement'}`;
-            
-            console.log('Game state updated:', this.gameState);
-            
+            // One request for the whole state; 304 means nothing changed since the last one
+            const headers = this.stateVersion ? { 'If-None-Match': this.stateVersion } : {};
+            const response = await this.api('/state', { headers });
+            if (response.status === 304) {
+                return;
+            }
+            this.applyState(await response.json());
         } catch (error) {
             console.error('Error updating game state:', error);
         }
     }
 
+    applyState(state) {
+        // Take in a state snapshot, from /state or returned by a move
+        this.lastState = state;
+        this.board = state.board;
+        this.stateVersion = state.version;
+        this.gameState.whiteCount = state.pieces.W;
+        this.gameState.blackCount = state.pieces.B;
+        this.gameState.whiteRemoved = state.removed.W;
+        this.gameState.blackRemoved = state.removed.B;
+        this.gameState.placed = state.placed;
+        this.gameState.currentPlayer = state.player;
+        this.gameState.gameActive = state.game_active;
+        this.gameState.phase = state.phase;
+        
+        // Update UI elements
+        document.getElementById('white-count').textContent = state.pieces.W;
+        document.getElementById('black-count').textContent = state.pieces.B;
+        document.getElementById('white-removed').textContent = state.removed.W;
+        document.getElementById('black-removed').textContent = state.removed.B;
+        document.getElementById('current-player').textContent = 
+            `Current Player: ${this.gameState.currentPlayer === 'W' ? 'White' : 'Black'}`;
+        document.getElementById('game-phase').textContent = 
+            `Phase: ${this.gameState.phase === 'placement' ? 'Placement' : 'Movement'}`;
+        
+        console.log('Game state updated:', this.gameState);
+    }
+
     setupEventListeners() {
         // Game control buttons
         document.getElementById('start-game').addEventListener('click', () => this.startNewGame());
@@ -232,27 +242,25 @@ class SixMensMorrisUI {
 
     async handlePlacement(x, y) {
         try {
-            const response = await fetch(`/place?x=${x}&y=${y}`, {
+            const response = await this.api(`/place?x=${x}&y=${y}`, {
                 method: 'POST'
             });
 
             if (response.ok) {
-                const success = await response.json();
-                if (success) {
-                    await this.updateGameState();
+                const result = await response.json();
+                if (result.success) {
+                    this.applyState(result);
                     this.updateBoardDisplay();
                     this.updateButtonStates();
                     
                     // Check for mill formation
-                    const millFormed = await this.checkMill(x, y, this.gameState.currentPlayer);
-                    if (millFormed) {
+                    if (result.mill) {
                         this.showMessage(`${this.gameState.currentPlayer === 'W' ? 'White' : 'Black'} formed a mill! Remove an opponent's piece.`, 'info');
                         await this.handleMillRemoval(this.gameState.currentPlayer);
                     } else {
                         // Check for win
-                        const win = await this.checkWin();
-                        if (win) {
-                            this.handleVictory(this.gameState.currentPlayer);
+                        if (result.winner) {
+                            this.handleVictory(result.winner);
                             this.updateBoardDisplay();
                             return;
                         }
@@ -277,28 +285,25 @@ class SixMensMorrisUI {
             const [srcX, srcY] = this.selectedPosition;
             console.log(`Attempting move from (${srcX}, ${srcY}) to (${x}, ${y})`);
             try {
-                const response = await fetch(`/move?x=${srcX}&y=${srcY}&nx=${x}&ny=${y}`, {
+                const response = await this.api(`/move?x=${srcX}&y=${srcY}&nx=${x}&ny=${y}`, {
                     method: 'POST'
                 });
 
                 if (response.ok) {
-                    const success = await response.json();
-                    if (success) {
+                    const result = await response.json();
+                    if (result.success) {
+                        this.applyState(result);
                         this.clearSelection();
-                        await this.updateGameState();
-                        this.updateBoardDisplay();
                         this.updateButtonStates();
                         
                         // Check for mill formation
-                        const millFormed = await this.checkMill(x, y, this.gameState.currentPlayer);
-                        if (millFormed) {
+                        if (result.mill) {
                             this.showMessage(`${this.gameState.currentPlayer === 'W' ? 'White' : 'Black'} formed a mill! Remove an opponent's piece.`, 'info');
                             await this.handleMillRemoval(this.gameState.currentPlayer);
                         } else {
                             // Check for win
-                            const win = await this.checkWin();
-                            if (win) {
-                                this.handleVictory(this.gameState.currentPlayer);
+                            if (result.winner) {
+                                this.handleVictory(result.winner);
                                 this.updateBoardDisplay();
                                 return;
                             }
@@ -363,26 +368,24 @@ class SixMensMorrisUI {
                 position.style.cursor = 'pointer';
                 position.addEventListener('click', async () => {
                     try {
-                        const response = await fetch(`/remove_piece?x=${x}&y=${y}&player=${playerWhoFormedMill}`, {
+                        const response = await this.api(`/remove_piece?x=${x}&y=${y}&player=${playerWhoFormedMill}`, {
                             method: 'POST'
                         });
 
                         if (response.ok) {
-                            const success = await response.json();
-                            if (success) {
+                            const result = await response.json();
+                            if (result.success) {
                                 console.log('Piece removal successful');
                                 
                                 // Update game state (backend already switched player)
-                                await this.updateGameState();
-                                console.log('Game state updated');
+                                this.applyState(result);
                                 this.updateBoardDisplay();
                                 console.log('Board display updated');
                                 this.updateButtonStates();
                                 
                                 // Check for win
-                                const win = await this.checkWin();
-                                if (win) {
-                                    this.handleVictory(this.gameState.currentPlayer);
+                                if (result.winner) {
+                                    this.handleVictory(result.winner);
                                     this.updateBoardDisplay();
                                     return;
                                 }
@@ -415,46 +418,57 @@ class SixMensMorrisUI {
         }
         
         const depth = parseInt(document.getElementById('ai-depth').value) || 3;
+        const timeMs = parseInt(document.getElementById('ai-time').value);
+        // With a time limit the search deepens until time runs out, ignoring the depth
+        const query = timeMs > 0 ? `time_ms=${timeMs}` : `depth=${depth}`;
         
         try {
+            this.thinking = true;
             this.showMessage('Computer is thinking...', 'info');
             
-            const response = await fetch(`/computer_move?depth=${depth}`, {
+            const response = await this.api(`/computer_move?${query}`, {
                 method: 'POST'
             });
 
             if (response.ok) {
-                await this.updateGameState();
+                const result = await response.json();
+                this.applyState(result);
                 this.updateBoardDisplay();
                 this.updateButtonStates();
                 
                 // Check for win
-                const win = await this.checkWin();
-                if (win) {
-                    this.handleVictory(this.gameState.currentPlayer);
+                if (result.winner) {
+                    this.handleVictory(result.winner);
                     this.updateBoardDisplay();
                     return;
                 }
                 
                 // Switch player
-                await fetch('/switch', { method: 'POST' });
-                this.gameState.currentPlayer = this.gameState.currentPlayer === 'W' ? 'B' : 'W';
-                this.updateUI();
-                this.showMessage('Computer move completed.', 'success');
+                const switched = await this.api('/switch', { method: 'POST' });
+                this.applyState(await switched.json());
+                this.showMessage(result.depth > 0
+                    ? `Computer move completed (searched to depth ${result.depth}).`
+                    : 'Computer move completed.', 'success');
             } else {
+                // The game may have changed meanwhile (409), so show its current state
+                await this.updateGameState();
+                this.updateBoardDisplay();
                 this.showMessage('Error making computer move.', 'error');
             }
         } catch (error) {
             this.showMessage('Error: ' + error.message, 'error');
+        } finally {
+            this.thinking = false;
         }
     }
 
     async undoMove() {
         try {
-            const response = await fetch('/undo', { method: 'POST' });
+            const response = await this.api('/undo', { method: 'POST' });
+            const result = await response.json();
             
-                    if (response.ok) {
-            await this.updateGameState();
+                    if (response.ok && result.success) {
+            this.applyState(result);
             this.updateBoardDisplay();
             this.updateButtonStates();
             this.clearSelection();
@@ -469,9 +483,11 @@ class SixMensMorrisUI {
 
     async updateBoardDisplay() {
         try {
-            // Get the current board state from the server
-            const boardResponse = await fetch('/get_board');
-            const board = await boardResponse.json();
+            // Board of the last state snapshot from the server
+            const board = this.board;
+            if (!board) {
+                return;
+            }
             
             console.log('Updating board display with', this.boardPositions.length, 'positions');
             console.log('Board state from server:', board);
@@ -607,39 +623,70 @@ class SixMensMorrisUI {
     }
 
     // API helper methods
-    async getPieceCount(player) {
-        const response = await fetch(`/get_piece_count?player=${player}`);
-        return await response.json();
-    }
-
-    async checkMill(x, y, player) {
-        const response = await fetch(`/check_mill?x=${x}&y=${y}&player=${player}`);
-        return await response.json();
-    }
-
-    async checkWin() {
-        const response = await fetch('/check_win');
-        return await response.json();
-    }
-
-    async getCurrentPlayer() {
-        const response = await fetch('/get_current_player');
-        return await response.json();
+    async start() {
+        // Restart this page's game, or get a new one if the server has dropped it
+        const query = this.gameId ? `?game_id=${encodeURIComponent(this.gameId)}` : '';
+        const response = await fetch(`/start${query}`, { method: 'POST' });
+        const state = await response.json();
+        if (state.game_id !== this.gameId || !this.socket) {
+            this.gameId = state.game_id;
+            this.connect();
+        }
+        this.applyState(state);
     }
 
-    async getPlacedCount() {
-        const response = await fetch('/get_placed_count');
-        return await response.json();
+    connect() {
+        // Follow the game over a WebSocket, so changes made elsewhere show up too
+        if (this.socket) {
+            this.socket.close();
+        }
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${location.host}/ws?game_id=${encodeURIComponent(this.gameId)}`);
+        socket.onmessage = (event) => this.handlePush(JSON.parse(event.data));
+        socket.onclose = () => {
+            if (this.socket === socket) {
+                this.socket = null;
+            }
+        };
+        this.socket = socket;
     }
 
-    async getGameActive() {
-        const response = await fetch('/get_game_active');
-        return await response.json();
+    handlePush(message) {
+        if (message.type === 'progress') {
+            if (this.thinking) {
+                const best = message.best_move ? `, best move so far ${JSON.stringify(message.best_move)}` : '';
+                this.showMessage(`Computer is thinking... depth ${message.depth}, ${message.nodes} nodes${best}`, 'info');
+            }
+            return;
+        }
+        // Diffs are against the previous message's state
+        const state = message.type === 'diff' ? { ...this.pushedState, ...message.changes } : message.state;
+        this.pushedState = state;
+        // Moves made from this page are applied from their responses instead
+        if (this.requests > 0 || state.version === this.stateVersion) {
+            return;
+        }
+        this.applyState(state);
+        this.updateBoardDisplay();
+        this.updateButtonStates();
+        if (state.winner && !this.gameState.victor) {
+            this.handleVictory(state.winner);
+        }
     }
 
-    async getRemovedCount(player) {
-        const response = await fetch(`/get_removed_count?player=${player}`);
-        return await response.json();
+    async api(path, options) {
+        const separator = path.includes('?') ? '&' : '?';
+        const sending = options && options.method === 'POST';
+        if (sending) {
+            this.requests++;
+        }
+        try {
+            return await fetch(`${path}${separator}game_id=${encodeURIComponent(this.gameId)}`, options);
+        } finally {
+            if (sending) {
+                this.requests--;
+            }
+        }
     }
 }
 
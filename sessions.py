@@ -0,0 +1,103 @@
+"""
+In-memory store of the web server's games, one per session.
+
+Games are kept in least recently used order. A game is dropped when it
+has not been used for `ttl` seconds, or when the store holds more than
+`max_games` games or more than `max_bytes` of them, least recently used
+first. Sizes are estimates, measured again every time a game is used: a
+game's history is allocated in full when it starts, but its move ordering
+tables, search statistics and transposition table (charged as if full,
+if it has one) can grow.
+"""
+import os
+import secrets
+import sys
+import time
+from collections import OrderedDict
+
+from main import Game
+
+MAX_GAMES = int(os.environ.get("MORRIS_MAX_GAMES", 10000))
+TTL = float(os.environ.get("MORRIS_SESSION_TTL", 3600))
+MAX_BYTES = int(float(os.environ.get("MORRIS_SESSION_MEMORY_MB", 256)) * 1024 * 1024)
+
+
+def new_game():
+    # Searches run in the worker processes, so the server's games need no transposition table
+    return Game(tt_size=0)
+
+
+# Bytes of a filled transposition table slot: the tuple of key, depth, flag, score, move and
+# generation, with a key too large for a small int
+TT_ENTRY_SIZE = sys.getsizeof((0,) * 6) + sys.getsizeof(1 << 63)
+
+
+def game_size(game):
+    """Estimated bytes held by a game"""
+    parts = [game, game.__dict__, game.position, game.history, game.history.entries, game.ordering,
+             game.killers, *game.killers, game.cutoffs_by_ply,
+             game.history_scores, game.history_scores['W'], game.history_scores['B']]
+    if game.last_search is not None:
+        parts += [game.last_search, game.last_search["pv"], game.last_search["cutoffs_by_ply"]]
+    size = sum(sys.getsizeof(part) for part in parts)
+    if game.tt is not None:
+        size += sys.getsizeof(game.tt) + sys.getsizeof(game.tt.slots) + game.tt.size * TT_ENTRY_SIZE
+    return size
+
+
+class SessionStore:
+    """Games by ID with LRU, TTL and memory-based eviction"""
+
+    def __init__(self, max_games=MAX_GAMES, ttl=TTL, max_bytes=MAX_BYTES):
+        self.max_games = max_games
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # game_id -> [game, last used (monotonic seconds), estimated size], oldest first
+        self.games = OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.games)
+
+    def create(self):
+        """Add a new game and return (game_id, game)"""
+        game_id = secrets.token_urlsafe(12)
+        game = new_game()
+        size = game_size(game)
+        self.games[game_id] = [game, time.monotonic(), size]
+        self.bytes += size
+        self._evict()
+        return game_id, game
+
+    def get(self, game_id):
+        """The game with this ID, or None if it does not exist or was evicted"""
+        entry = self.games.get(game_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry[1] > self.ttl:
+            self._drop(game_id)
+            return None
+        self.games.move_to_end(game_id)
+        entry[1] = now
+        size = game_size(entry[0])
+        self.bytes += size - entry[2]
+        entry[2] = size
+        self._evict()
+        return entry[0]
+
+    def _drop(self, game_id):
+        self.bytes -= self.games.pop(game_id)[2]
+        self.evicted += 1
+
+    def _evict(self):
+        now = time.monotonic()
+        # The most recently used game always stays
+        while len(self.games) > 1:
+            game_id, (_, used, _) = next(iter(self.games.items()))
+            if (now - used > self.ttl or len(self.games) > self.max_games
+                    or self.bytes > self.max_bytes):
+                self._drop(game_id)
+            else:
+                break
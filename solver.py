@@ -0,0 +1,101 @@
+"""
+Strong solution of Six Men's Morris.
+
+Extends the movement-phase tablebase of tablebase.py back through the
+placement phase, giving the exact value of every position with 0 to 11
+pieces placed, the empty board included. Placement positions are stored in
+the same file format and with the same symmetry-reduced index, in sections
+keyed by the number of pieces placed so far. Every placement adds a piece,
+so the positions with p pieces placed only lead to positions with p + 1
+placed and each layer is solved in a single pass, from the last placement
+back to the first.
+
+Build the solution with
+
+    python solver.py --out tablebase.bin
+
+It contains the whole tablebase, so it is loaded in its place with
+Game.load_tablebase("tablebase.bin"). Solved sections are checkpointed to a
+work directory; run the same command again to resume an interrupted build.
+"""
+import argparse
+import time
+
+from main import POPCOUNT, legal_moves
+from tablebase import (MOVEMENT, Checkpoints, best_value, decode, movement_value, position_index,
+                       section_positions, section_size, solve_movement, write)
+
+RESULTS = {1: "a win", 0: "a draw", -1: "a loss"}
+
+
+def placement_classes(placed):
+    """Material classes (own pieces, opponent's pieces) of the side to move with placed pieces placed"""
+    # The side to move has placed placed // 2 pieces, its opponent the rest
+    return [(own, opponent) for own in range(placed // 2 + 1) for opponent in range((placed + 1) // 2 + 1)]
+
+
+def _solve_layer_class(placed, own_count, opponent_count, store):
+    """Solve the placement positions of one material class given the layer after it"""
+    values = bytearray(section_size(own_count, opponent_count))
+
+    def child(own, opponent):
+        """Value byte of the position after a placement, for the opponent to move"""
+        section = store.load((placed + 1, POPCOUNT[own], POPCOUNT[opponent]))
+        return section[position_index(own, opponent)]
+
+    def movement(own, opponent):
+        return store.load((MOVEMENT, POPCOUNT[own], POPCOUNT[opponent]))[position_index(own, opponent)]
+
+    last = placed + 1 == MOVEMENT
+    for index, own, opponent in section_positions(own_count, opponent_count):
+        children = []
+        for move in legal_moves(own, opponent, True):
+            moved = own | 1 << move.dst
+            rest = opponent if move.removed is None else opponent ^ 1 << move.removed
+            children.append(movement_value(rest, moved, movement) if last else child(rest, moved))
+        values[index] = best_value(children)
+    return values
+
+
+def solve_placement(store, log=print):
+    """Solve every placement layer into store, which must hold the whole movement phase"""
+    for placed in range(MOVEMENT - 1, -1, -1):
+        start = time.perf_counter()
+        positions = 0
+        for own_count, opponent_count in placement_classes(placed):
+            key = (placed, own_count, opponent_count)
+            if key not in store:
+                store.save(key, _solve_layer_class(placed, own_count, opponent_count, store))
+            positions += len(store.load(key))
+        log(f"  {placed} placed: {positions} slots ({time.perf_counter() - start:.1f}s)")
+
+
+def build(path, log=print, work_dir=None):
+    """Solve the whole game and write the solution file"""
+    store = Checkpoints(work_dir or path + ".parts")
+    log("Movement phase:")
+    solve_movement(store, log=log)
+    log("Placement phase:")
+    solve_placement(store, log)
+    outcome, distance = decode(store.load((0, 0, 0))[0])
+    if distance is None:
+        log(f"Six Men's Morris is {RESULTS[outcome]} with perfect play.")
+    else:
+        log(f"Six Men's Morris is {RESULTS[outcome]} for the first player in {distance} plies.")
+    write(path, {key: store.load(key) for key in store.keys()})
+    store.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve Six Men's Morris and write the solution database")
+    parser.add_argument("--out", default="tablebase.bin")
+    parser.add_argument("--work-dir", help="where solved sections are checkpointed (default: OUT.parts)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build(args.out, work_dir=args.work_dir)
+    print(f"Wrote {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
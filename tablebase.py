@@ -0,0 +1,441 @@
+"""
+Endgame tablebase for Six Men's Morris, and the database format shared with
+the full solution built by solver.py.
+
+Every movement-phase position with 3 to 6 pieces per side is solved by
+retrograde analysis and stored as one byte per position:
+
+    0          draw (neither side can force a win)
+    d + 1      the game ends after d more plies with best play; the side to
+               move wins when d is odd and loses when d is even
+
+Positions are stored from the point of view of the side to move (its own
+pieces and its opponent's, whatever their colour) and only once per
+symmetry class: the own pieces are mapped to the smallest of their 16
+images under the board symmetries, and the opponent's pieces to the
+smallest image left by the symmetries that achieve it. A position's index
+within its section is the number of its canonical own mask followed by the
+combinatorial rank of the opponent's pieces on the remaining points, a
+perfect hash with only a few unused slots for own masks that are
+themselves symmetric.
+
+The file is a small header followed by one section per placed count and
+material class and is read through mmap, so probing costs a few table
+lookups and no loading time. Build it once with
+
+    python tablebase.py --out tablebase.bin
+
+and load it with Game.load_tablebase("tablebase.bin"). Solved sections are
+checkpointed to a work directory as they finish, so an interrupted build
+picks up where it stopped when run again.
+"""
+import argparse
+import mmap
+import os
+import shutil
+import struct
+import time
+from array import array
+from math import comb
+
+from main import (ADJACENT_MASKS, CANONICAL_MASK, CANONICAL_SYMMETRIES, FULL, POPCOUNT, Game, bits,
+                  canonical_form, in_mill, legal_moves, transform)
+
+MAGIC = b"SMMTB2\0\0"
+HEADER = struct.Struct("<8sI")
+# placed count, pieces of the side to move, opponent's pieces, offset, length
+SECTION = struct.Struct("<BBBxQQ")
+# Sections of the movement phase are stored under this placed count
+MOVEMENT = 12
+MIN_PIECES = 3
+MAX_PIECES = 6
+MAX_DISTANCE = 254
+
+WIN, DRAW, LOSS = 1, 0, -1
+
+POINT_COUNT = len(Game.adjacent)
+
+
+def _build_ranks():
+    # RANK[mask] is the position of mask among the masks with the same number
+    # of pieces, in numeric order; UNRANK[k] lists the masks with k pieces.
+    # Masks that fit in the low n bits come first, so the same tables rank
+    # the opponent's pieces once they are compressed onto the free points.
+    rank = [0] * (FULL + 1)
+    unrank = [[] for _ in range(POINT_COUNT + 1)]
+    for mask in range(FULL + 1):
+        group = unrank[POPCOUNT[mask]]
+        rank[mask] = len(group)
+        group.append(mask)
+    return rank, unrank
+
+
+def _build_reps():
+    # REPS[k] lists the canonical masks with k pieces, REP_INDEX numbers them
+    reps = [[] for _ in range(POINT_COUNT + 1)]
+    rep_index = [-1] * (FULL + 1)
+    for mask in range(FULL + 1):
+        if CANONICAL_MASK[mask] == mask:
+            group = reps[POPCOUNT[mask]]
+            rep_index[mask] = len(group)
+            group.append(mask)
+    return reps, rep_index
+
+
+RANK, UNRANK = _build_ranks()
+REPS, REP_INDEX = _build_reps()
+BELOW = [(1 << i) - 1 for i in range(POINT_COUNT)]
+# OPPONENT_RANKS[a][b]: placements of b opponent pieces next to a own pieces
+OPPONENT_RANKS = [[comb(POINT_COUNT - a, b) for b in range(POINT_COUNT + 1)] for a in range(POINT_COUNT + 1)]
+
+
+def compress(mask, occupied):
+    """Pack the bits of mask onto the points not in occupied"""
+    packed = 0
+    for i in bits(mask):
+        packed |= 1 << (i - POPCOUNT[occupied & BELOW[i]])
+    return packed
+
+
+def expand(packed, free):
+    """Inverse of compress, given the list of unoccupied points"""
+    mask = 0
+    for j in bits(packed):
+        mask |= 1 << free[j]
+    return mask
+
+
+def section_size(own_count, opponent_count):
+    """Slots in the section of a material class"""
+    return len(REPS[own_count]) * OPPONENT_RANKS[own_count][opponent_count]
+
+
+def position_index(own, opponent):
+    """Index of a position within its section, found through its canonical form"""
+    _, own, opponent = canonical_form(own, opponent)
+    return (REP_INDEX[own] * OPPONENT_RANKS[POPCOUNT[own]][POPCOUNT[opponent]]
+            + RANK[compress(opponent, own)])
+
+
+def section_positions(own_count, opponent_count):
+    """Yields (index, own, opponent) for the canonical positions of a section"""
+    ranks = OPPONENT_RANKS[own_count][opponent_count]
+    for r, own in enumerate(REPS[own_count]):
+        free = [i for i in range(POINT_COUNT) if not own >> i & 1]
+        stabilizer = CANONICAL_SYMMETRIES[own]
+        for k, packed in enumerate(UNRANK[opponent_count][:ranks]):
+            opponent = expand(packed, free)
+            # Slots whose opponent mask is not the smallest of its images stay unused
+            if len(stabilizer) > 1 and min(transform(opponent, s) for s in stabilizer) != opponent:
+                continue
+            yield r * ranks + k, own, opponent
+
+
+def position_at(own_count, opponent_count, index):
+    """Inverse of position_index for a canonical position"""
+    r, k = divmod(index, OPPONENT_RANKS[own_count][opponent_count])
+    own = REPS[own_count][r]
+    free = [i for i in range(POINT_COUNT) if not own >> i & 1]
+    return own, expand(UNRANK[opponent_count][k], free)
+
+
+def decode(value):
+    """Turn a stored byte into (WIN/DRAW/LOSS, distance in plies) for the side to move"""
+    if value == 0:
+        return DRAW, None
+    distance = value - 1
+    return (WIN if distance & 1 else LOSS), distance
+
+
+def best_value(children):
+    """Value byte of a position from the value bytes of all the positions its moves reach"""
+    win = None
+    longest = 0
+    drawn = False
+    for value in children:
+        if value == 0:
+            drawn = True
+        elif value & 1:
+            # The opponent loses after value - 1 more plies
+            if win is None or value < win:
+                win = value
+        elif value > longest:
+            longest = value
+    if win is not None:
+        return win + 1
+    if drawn:
+        return 0
+    return longest + 1
+
+
+def movement_value(own, opponent, probe):
+    """
+    Value byte of a movement-phase position, applying the rules for two
+    pieces or less and otherwise calling probe(own, opponent). As in
+    Game.outcome, an opponent down to two pieces has lost whatever the side
+    to move has left; the format has no win in 0 plies, so that is stored
+    as a win in 1 (probe_position answers it exactly).
+    """
+    # The last move took the opponent down to two pieces
+    if POPCOUNT[opponent] <= 2:
+        return 2
+    # The side to move has lost already
+    if POPCOUNT[own] <= 2:
+        return 1
+    return probe(own, opponent)
+
+
+class Tablebase:
+    """Read-only, memory-mapped view of a tablebase or solution file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Six Men's Morris tablebase")
+        self.sections = {}
+        for n in range(count):
+            placed, own, opponent, offset, length = SECTION.unpack_from(self.data, HEADER.size + n * SECTION.size)
+            self.sections[(placed, own, opponent)] = offset
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def covers(self, own, opponent, placed=MOVEMENT):
+        """Check if positions with these piece counts and placed count can be probed"""
+        own_count = POPCOUNT[own]
+        opponent_count = POPCOUNT[opponent]
+        if placed >= MOVEMENT and (own_count <= 2 or opponent_count <= 2):
+            return True
+        return (min(placed, MOVEMENT), own_count, opponent_count) in self.sections
+
+    def lookup(self, own, opponent, placed=MOVEMENT):
+        """Stored value byte of a position, or None if its section was not built"""
+        offset = self.sections.get((min(placed, MOVEMENT), POPCOUNT[own], POPCOUNT[opponent]))
+        if offset is None:
+            return None
+        return self.data[offset + position_index(own, opponent)]
+
+    def probe_position(self, own, opponent, placed=MOVEMENT):
+        """
+        Look up a position given the pieces of the side to move and of its
+        opponent. Returns (WIN/DRAW/LOSS, distance) for the side to move, or
+        None if the position is not covered.
+        """
+        if placed >= MOVEMENT:
+            if POPCOUNT[opponent] <= 2:
+                # Already won, like Game.outcome says
+                return WIN, 0
+            value = movement_value(own, opponent, self.lookup)
+        else:
+            value = self.lookup(own, opponent, placed)
+        return None if value is None else decode(value)
+
+    def probe(self, white, black, black_to_move):
+        """Look up a movement-phase position, see probe_position"""
+        if black_to_move:
+            return self.probe_position(black, white)
+        return self.probe_position(white, black)
+
+
+class Checkpoints:
+    """
+    Solved sections kept in memory and saved one file each under a work
+    directory, so that a build can be resumed after an interruption.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.solved = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, "%d-%d-%d.bin" % key)
+
+    def __contains__(self, key):
+        return key in self.solved or os.path.exists(self.path(key))
+
+    def load(self, key):
+        values = self.solved.get(key)
+        if values is None:
+            with open(self.path(key), "rb") as f:
+                values = self.solved[key] = bytearray(f.read())
+        return values
+
+    def save(self, key, values):
+        # Write to a temporary file first so a checkpoint is never left half written
+        path = self.path(key)
+        with open(path + ".tmp", "wb") as f:
+            f.write(values)
+        os.replace(path + ".tmp", path)
+        self.solved[key] = values
+
+    def keys(self):
+        """Keys of every checkpointed section"""
+        names = (name[:-len(".bin")] for name in os.listdir(self.directory) if name.endswith(".bin"))
+        return sorted(tuple(int(n) for n in name.split("-")) for name in names)
+
+    def remove(self):
+        shutil.rmtree(self.directory)
+
+
+def _solve_pair(a, b, store, log):
+    """
+    Solve the material classes (a, b) and (b, a) of the movement phase, which
+    lead into each other, given the classes with one piece less.
+    """
+    keys = [(a, b)] if a == b else [(a, b), (b, a)]
+    # Both classes share the arrays below, (a, b) first
+    split = section_size(a, b)
+    size = sum(section_size(*key) for key in keys)
+    offsets = {a: 0, b: size - section_size(b, a)}
+    # counters[p]: symmetry classes reached from p without capturing whose
+    # value is still unknown; ceiling[p]: the longest loss p can be forced
+    # into through captures; blocked[p]: a capture reaches a draw or a win,
+    # so p cannot be lost
+    counters = array("H", bytes(2 * size))
+    ceiling = bytearray(size)
+    blocked = bytearray(size)
+    values = bytearray(size)
+    # buckets[d] holds positions that may be decided at distance d
+    buckets = [[] for _ in range(MAX_DISTANCE + 2)]
+
+    def lower(own, opponent):
+        """Value byte of a position reached by a capture, in an already solved class"""
+        return store.load((MOVEMENT, POPCOUNT[own], POPCOUNT[opponent]))[position_index(own, opponent)]
+
+    start = time.perf_counter()
+    positions = 0
+    for own_count, opponent_count in keys:
+        base = offsets[own_count]
+        child_base = offsets[opponent_count]
+        for index, own, opponent in section_positions(own_count, opponent_count):
+            positions += 1
+            p = base + index
+            children = set()
+            win = None
+            longest = 0
+            has_moves = False
+            for move in legal_moves(own, opponent, False):
+                has_moves = True
+                moved = own ^ 1 << move.src | 1 << move.dst
+                if move.removed is None:
+                    children.add(child_base + position_index(opponent, moved))
+                    continue
+                rest = opponent ^ 1 << move.removed
+                if POPCOUNT[rest] <= 2:
+                    win = 1
+                    continue
+                value = lower(rest, moved)
+                if value == 0:
+                    blocked[p] = 1
+                elif value & 1:
+                    if win is None or value < win:
+                        win = value
+                elif value > longest:
+                    longest = value
+            if not has_moves:
+                buckets[0].append(p)
+                continue
+            counters[p] = len(children)
+            ceiling[p] = longest
+            if win is not None:
+                blocked[p] = 1
+                buckets[win].append(p)
+            elif not children and not blocked[p]:
+                buckets[longest].append(p)
+
+    decided = 0
+    for distance in range(MAX_DISTANCE + 1):
+        bucket = buckets[distance]
+        buckets[distance] = None
+        for p in bucket:
+            if values[p]:
+                continue
+            values[p] = distance + 1
+            decided += 1
+            own_count, opponent_count = (a, b) if p < split else (b, a)
+            own, opponent = position_at(own_count, opponent_count, p - offsets[own_count])
+            # Undo non-capturing moves of the opponent, who moved last; every
+            # symmetry class with a move into p's class has a member with a
+            # move to p itself
+            empty = FULL ^ (own | opponent)
+            flying = opponent_count <= 3
+            base = offsets[opponent_count]
+            predecessors = set()
+            for dst in bits(opponent):
+                if in_mill(opponent, dst):
+                    continue
+                sources = empty if flying else ADJACENT_MASKS[dst] & empty
+                for src in bits(sources):
+                    predecessors.add(base + position_index(opponent ^ 1 << dst | 1 << src, own))
+            for q in predecessors:
+                if values[q]:
+                    continue
+                if distance & 1 == 0:
+                    # p is lost for the player to move, so q wins by moving to it
+                    buckets[distance + 1].append(q)
+                else:
+                    counters[q] -= 1
+                    if counters[q] == 0 and not blocked[q]:
+                        buckets[max(distance + 1, ceiling[q])].append(q)
+        if buckets[distance + 1] and distance + 1 > MAX_DISTANCE:
+            raise OverflowError(f"distance to the end exceeds {MAX_DISTANCE} plies")
+
+    names = " and ".join(f"{own_count}v{opponent_count}" for own_count, opponent_count in keys)
+    log(f"  {names}: {positions} positions, {decided} decided, "
+        f"{positions - decided} drawn ({time.perf_counter() - start:.1f}s)")
+    return {key: values[offsets[key[0]]:offsets[key[0]] + section_size(*key)] for key in keys}
+
+
+def solve_movement(store, max_pieces=2 * MAX_PIECES, log=print):
+    """Solve every movement-phase class with at most max_pieces pieces on the board into store"""
+    for total in range(2 * MIN_PIECES, max_pieces + 1):
+        for a in range(MIN_PIECES, MAX_PIECES + 1):
+            b = total - a
+            if not a <= b <= MAX_PIECES:
+                continue
+            if (MOVEMENT, a, b) in store and (MOVEMENT, b, a) in store:
+                continue
+            for (own_count, opponent_count), values in _solve_pair(a, b, store, log).items():
+                store.save((MOVEMENT, own_count, opponent_count), values)
+
+
+def write(path, sections):
+    """Write sections keyed by (placed, own count, opponent count) to a tablebase file"""
+    offset = HEADER.size + SECTION.size * len(sections)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(sections)))
+        for (placed, own, opponent), values in sorted(sections.items()):
+            f.write(SECTION.pack(placed, own, opponent, offset, len(values)))
+            offset += len(values)
+        for key, values in sorted(sections.items()):
+            f.write(values)
+
+
+def build(path, max_pieces=2 * MAX_PIECES, log=print, work_dir=None):
+    """Solve the movement phase up to max_pieces pieces on the board and write the file"""
+    store = Checkpoints(work_dir or path + ".parts")
+    solve_movement(store, max_pieces, log)
+    write(path, {key: store.load(key) for key in store.keys()})
+    store.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the movement-phase endgame tablebase")
+    parser.add_argument("--out", default="tablebase.bin")
+    parser.add_argument("--max-pieces", type=int, default=2 * MAX_PIECES,
+                        help="largest total number of pieces on the board to solve (6-12)")
+    parser.add_argument("--work-dir", help="where solved sections are checkpointed (default: OUT.parts)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build(args.out, args.max_pieces, work_dir=args.work_dir)
+    print(f"Wrote {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
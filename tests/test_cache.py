@@ -0,0 +1,95 @@
+import pytest
+
+from cache import SearchCache
+from main import SYMMETRIES, Game, Move, history_entry, transform
+
+# Positions after a few placements and in the movement phase, in Game.to_notation's form
+POSITIONS = ["W...B.W....B.... W 4", "WW.B.B..WB.B.W.. W 10", "W.BBW.B..WW.BBW. W 12"]
+
+
+def image(game, symmetry):
+    # The game's position under one of the SYMMETRIES
+    white, black, player, placed = game.position.white, game.position.black, game.player, game.placed
+    return Game.at_position(transform(white, symmetry), transform(black, symmetry), player, placed, tt_size=0)
+
+
+def after(game, move):
+    # The pieces after a move in the format minimax returns
+    record = game.make_move(Move.from_tuple(move))
+    pieces = game.position.white, game.position.black
+    game.unmake_move(record)
+    return pieces
+
+
+@pytest.mark.parametrize("notation", POSITIONS)
+def test_key_is_the_same_for_every_symmetric_image(notation):
+    game = Game.from_notation(notation, tt_size=0)
+    key = SearchCache.key(game, "computer_move", 6)[0]
+    for symmetry in range(len(SYMMETRIES)):
+        assert SearchCache.key(image(game, symmetry), "computer_move", 6)[0] == key
+    assert SearchCache.key(game, "computer_move", 5)[0] != key
+    assert SearchCache.key(game, "remove_best_opponent_piece", 6)[0] != key
+
+
+@pytest.mark.parametrize("notation", POSITIONS)
+def test_minimax_move_maps_back_onto_every_image(notation):
+    game = Game.from_notation(notation, tt_size=0)
+    move = next(iter(game.legal_moves())).to_tuple()
+    cache = SearchCache(size=64)
+    cache.put_minimax(SearchCache.key(game, "minimax_white", 4), -100, 100, 15, move)
+    for symmetry in range(len(SYMMETRIES)):
+        other = image(game, symmetry)
+        score, found = cache.get_minimax(SearchCache.key(other, "minimax_white", 4), -100, 100)
+        assert score == 15
+        white, black = after(game, move)
+        assert after(other, found) == (transform(white, symmetry), transform(black, symmetry))
+
+
+def test_minimax_keeps_only_exact_scores():
+    game = Game.from_notation(POSITIONS[0], tt_size=0)
+    cache = SearchCache(size=64)
+    key = SearchCache.key(game, "minimax_black", 3)
+    cache.put_minimax(key, -10, 10, 10, None)
+    assert cache.get_minimax(key, -10, 10) is None
+    cache.put_minimax(key, -10, 10, 5, None)
+    assert cache.get_minimax(key, -10, 10) == (5, None)
+    # Exact in a wider window, but only a bound in a narrower one
+    assert cache.get_minimax(key, 0, 5) is None
+
+
+@pytest.mark.parametrize("path", [None, "cache.bin"])
+def test_played_entries_map_back_onto_every_image(tmp_path, path):
+    game = Game.from_notation("WW.B.B..WB.B.W.. W 10", tt_size=0)
+    # A placement forming a mill on (4, 0) and removing the black piece on (1, 1)
+    placed, removed = 2, 3
+    entries = [history_entry(None, placed, 'W'), history_entry(None, removed, 'B', removal=True)]
+    cache = SearchCache(size=64, path=path and str(tmp_path / path))
+    cache.put_played(SearchCache.key(game, "computer_move", 6), 6, entries)
+    if path:
+        # Another process, or a restart, sees it in the file
+        cache.close()
+        cache = SearchCache(size=64, path=str(tmp_path / path))
+    for symmetry, perm in enumerate(SYMMETRIES):
+        depth, found = cache.get_played(SearchCache.key(image(game, symmetry), "computer_move", 6))
+        assert depth == 6
+        assert found == [history_entry(None, perm[placed], 'W'),
+                         history_entry(None, perm[removed], 'B', removal=True)]
+    cache.close()
+
+
+def test_file_entry_count_follows_stores_and_evictions(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = SearchCache(size=16, path=path)
+    # Keys in one bucket: the last one evicts the first
+    keys = [(n << 40) | 1 for n in range(1, 6)]
+    for n, key in enumerate(keys):
+        cache.store(key, n + 1)
+    cache.store(keys[-1], 9)
+    assert (len(cache), cache.evictions) == (4, 1)
+    cache.store(2, 1)
+    assert len(cache) == 5
+    cache.close()
+    # Reopening counts the slots in use
+    cache = SearchCache(size=16, path=path)
+    assert len(cache) == 5
+    cache.close()
@@ -0,0 +1,76 @@
+import pytest
+
+from main import POINTS, Game, History, history_entry
+
+
+def placements(count):
+    # History entries of placements on points 0, 1, 2, ..., alternating players
+    return [history_entry(None, i % len(POINTS), 'W' if i % 2 == 0 else 'B') for i in range(count)]
+
+
+def test_keeps_the_newest_entries_when_full():
+    history = History(4)
+    entries = placements(10)
+    history.extend(entries)
+    assert len(history) == 4
+    assert list(history) == entries[-4:]
+
+
+def test_undo_and_redo_across_the_wraparound():
+    history = History(5)
+    entries = placements(7)
+    # The last placement formed a mill and removed a piece
+    removal = history_entry(None, 9, 'B', removal=True)
+    history.extend(entries + [removal])
+    assert list(history) == entries[-4:] + [removal]
+
+    assert history.undo() == [removal, entries[-1]]
+    assert history.undo() == [entries[-2]]
+    assert history.undo() == [entries[-3]]
+    assert history.undo() == [entries[-4]]
+    # The older entries were forgotten
+    assert history.undo() is None
+    assert len(history) == 0
+
+    assert history.redo() == [entries[-4]]
+    assert history.redo() == [entries[-3]]
+    assert history.redo() == [entries[-2]]
+    assert history.redo() == [entries[-1], removal]
+    assert history.redo() is None
+    assert list(history) == entries[-4:] + [removal]
+
+
+def test_push_after_undo_forgets_what_was_undone():
+    history = History(3)
+    entries = placements(5)
+    history.extend(entries)
+    history.undo()
+    history.push(entries[0])
+    assert history.redo() is None
+    assert list(history) == [entries[2], entries[3], entries[0]]
+
+
+def test_game_undo_stops_at_the_oldest_entry_kept():
+    game = Game(tt_size=0, history_size=3)
+    game.start()
+    snapshots = []
+    for x, y in [(0, 0), (2, 0), (4, 0), (1, 1), (2, 1)]:
+        snapshots.append(game.snapshot())
+        assert game.place(x, y)
+        game.switch()
+    final = game.snapshot()
+    for expected in reversed(snapshots[-3:]):
+        assert game.undo()
+        game.switch()
+        assert game.snapshot() == expected
+    assert not game.undo()
+    for _ in range(3):
+        assert game.redo()
+        game.switch()
+    assert game.snapshot() == final
+
+
+@pytest.mark.parametrize("size", [0, -1])
+def test_size_must_be_positive(size):
+    with pytest.raises(ValueError):
+        History(size)
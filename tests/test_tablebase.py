@@ -0,0 +1,34 @@
+import pytest
+
+from main import Game
+from tablebase import HEADER, MAGIC, WIN, Tablebase, decode, movement_value
+
+# Movement-phase positions whose opponent is down to two pieces, the last
+# with the side to move down to two as well, in Game.to_notation's form
+LOST = ["WWW.......BB.... W 12", "BBB.......WW.... B 12", "WW........BB.... W 12"]
+
+
+@pytest.fixture
+def tablebase(tmp_path):
+    # No sections: only the rules for two pieces or less answer
+    path = tmp_path / "empty.tb"
+    path.write_bytes(HEADER.pack(MAGIC, 0))
+    return Tablebase(str(path))
+
+
+@pytest.mark.parametrize("notation", LOST)
+def test_opponent_with_two_pieces_has_lost(notation, tablebase):
+    game = Game.from_notation(notation, tt_size=0)
+    opponent = 'B' if game.player == 'W' else 'W'
+    own, other = game.position.mask(game.player), game.position.mask(opponent)
+    assert game.outcome() == 1
+    assert tablebase.probe_position(own, other) == (WIN, 0)
+    assert decode(movement_value(own, other, lambda *_: None))[0] == WIN
+
+
+@pytest.mark.parametrize("notation", LOST)
+def test_tablebase_score_matches_the_search(notation, tablebase, monkeypatch):
+    game = Game.from_notation(notation, tt_size=0)
+    monkeypatch.setattr(Game, "tablebase", tablebase)
+    for ply in (0, 3):
+        assert game.probe_tablebase(ply) == game.evaluate() - (ply if game.player == 'W' else -ply)
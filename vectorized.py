@@ -0,0 +1,154 @@
+"""
+Evaluation of many positions at once with NumPy.
+
+Positions are packed as in pack_position, 5 bytes each, back to back (a
+bytes-like object or an (n, 5) uint8 array). evaluate gives the same score
+as Game.evaluate for every one of them, computed with array operations over
+the whole batch instead of a Python loop per position:
+
+    data = b''.join(game.to_packed() for game in games)
+    scores = vectorized.evaluate(data)
+
+NumPy is only needed by this module (pip install numpy). Run it to check
+it against Game.evaluate on a corpus of positions from random games:
+
+    python vectorized.py --positions 100000
+"""
+import argparse
+import random
+import time
+
+from main import ADJACENT_MASKS, MILL_MASKS, POINTS, WIN_SCORE, Game
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if np is not None:
+    # ADJACENCY[i, j] is 1 when points i and j are neighbours
+    ADJACENCY = np.array([[mask >> j & 1 for j in range(len(POINTS))] for mask in ADJACENT_MASKS],
+                         dtype=np.float32)
+    # LINES[i, k] is 1 when point i is on line k of Game.lines
+    LINES = np.array([[mill >> i & 1 for mill in MILL_MASKS] for i in range(len(POINTS))], dtype=np.float32)
+
+
+def records(positions):
+    """Packed positions as an (n, 5) uint8 array"""
+    if np is None:
+        raise RuntimeError("Vectorized evaluation needs NumPy: pip install numpy")
+    data = np.asarray(positions, dtype=np.uint8) if isinstance(positions, np.ndarray) else \
+        np.frombuffer(positions, dtype=np.uint8)
+    if data.size % 5:
+        raise ValueError(f"Packed positions are 5 bytes each, not {data.size} bytes in all")
+    return data.reshape(-1, 5)
+
+
+def features(positions):
+    """
+    The terms of Game.evaluate for every packed position, as a dict of
+    arrays with one entry per position:
+
+    - white_pieces, black_pieces: pieces on the board
+    - white_two_in_a_rows, black_two_in_a_rows: lines with two of the
+      player's pieces and an empty point
+    - white_mobility, black_mobility: moves the player would have in the
+      movement phase, flying with three pieces (0 with two or fewer)
+    - white_wins, black_wins: the game is won, as evaluate scores it
+
+    Raises ValueError if a position has both players on a point.
+    """
+    data = records(positions)
+    # Bit i of the little-endian 16-bit masks is point i
+    white = np.unpackbits(data[:, 0:2], axis=1, bitorder='little')
+    black = np.unpackbits(data[:, 2:4], axis=1, bitorder='little')
+    overlap = np.flatnonzero((white & black).any(axis=1))
+    if overlap.size:
+        raise ValueError(f"Both players on a point in packed position {overlap[0]}")
+    # Counting is done in float32, exact for these small sums, so that the products
+    # with the tables are matrix multiplications NumPy does fast
+    white = white.astype(np.float32)
+    black = black.astype(np.float32)
+    empty = 1 - white - black
+    placed = data[:, 4] & 127
+    white_to_move = data[:, 4] < 128
+
+    empty_lines = empty @ LINES
+    # Empty neighbours of every point
+    exits = empty @ ADJACENCY
+    empty_points = empty.sum(axis=1)
+    result = {}
+    stuck = {}
+    for name, own in (('white', white), ('black', black)):
+        pieces = own.sum(axis=1).astype(np.int32)
+        own_lines = own @ LINES
+        result[f"{name}_pieces"] = pieces
+        result[f"{name}_two_in_a_rows"] = ((own_lines == 2) & (empty_lines > 0)).sum(axis=1, dtype=np.int32)
+        mobility = np.where(pieces == 3, 3 * empty_points, (own * exits).sum(axis=1)).astype(np.int32)
+        result[f"{name}_mobility"] = np.where(pieces <= 2, 0, mobility)
+        # Game.check_win: in the movement phase, two pieces or no move loses
+        stuck[name] = (placed >= 12) & (result[f"{name}_mobility"] == 0)
+    # evaluate checks the player to move's win first, then the opponent's
+    white_wins = stuck['black'] & (white_to_move | ~stuck['white'])
+    result["white_wins"] = white_wins
+    result["black_wins"] = stuck['white'] & ~white_wins
+    return result
+
+
+def evaluate(positions):
+    """Game.evaluate of every packed position, as an int32 array"""
+    terms = features(positions)
+    score = ((terms["white_pieces"] - terms["black_pieces"]) * 10
+             + (terms["white_two_in_a_rows"] - terms["black_two_in_a_rows"]) * 5)
+    score = np.where(terms["black_wins"], -WIN_SCORE, score)
+    return np.where(terms["white_wins"], WIN_SCORE, score).astype(np.int32)
+
+
+def corpus(count, seed=0):
+    """count packed positions from random games, finished ones included, as bytes"""
+    rng = random.Random(seed)
+    game = Game(tt_size=0)
+    data = bytearray()
+    while len(data) < 5 * count:
+        game.start()
+        for _ in range(rng.randrange(1, 60)):
+            data += game.to_packed()
+            if game.placed >= 12 and game.get_piece_count(game.player) <= 2:
+                break
+            moves = list(game.legal_moves())
+            if not moves:
+                break
+            game.make_move(rng.choice(moves))
+    return bytes(data[:5 * count])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the vectorized evaluation against Game.evaluate and time both")
+    parser.add_argument("--positions", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = corpus(args.positions, args.seed)
+    start = time.perf_counter()
+    scores = evaluate(data)
+    vectorized = time.perf_counter() - start
+
+    games = [Game.from_packed(data[i:i + 5], tt_size=0) for i in range(0, len(data), 5)]
+    start = time.perf_counter()
+    expected = [game.evaluate() for game in games]
+    serial = time.perf_counter() - start
+
+    mismatches = [i for i, score in enumerate(expected) if scores[i] != score]
+    count = len(expected)
+    print(f"{count} positions: vectorized {vectorized * 1e6 / count:.2f}us each, "
+          f"Game.evaluate {serial * 1e6 / count:.2f}us each ({serial / vectorized:.0f}x)")
+    if mismatches:
+        i = mismatches[0]
+        print(f"{len(mismatches)} MISMATCHES, first {Game.from_packed(data[5 * i:5 * i + 5]).to_notation()}: "
+              f"{scores[i]} instead of {expected[i]}")
+    else:
+        print("All scores match Game.evaluate")
+
+
+if __name__ == "__main__":
+    main()
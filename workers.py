@@ -0,0 +1,200 @@
+"""
+Process pool for the computer's searches, so that a deep search does not
+block the web server's event loop.
+
+The web server sends a snapshot of its game to a worker process, which
+replays it on a Game of its own, and applies the result to the game when
+it comes back. Each worker keeps its Game, and so its transposition table,
+between requests, except for fresh searches: those start from an empty
+table and move ordering history, so that their result depends only on the
+position, which is what lets the server cache it. At most `workers` searches run at once and at most
+`queue_limit` more wait for a worker; further requests are turned away
+with PoolBusy.
+
+Searches can report their progress (see Game.progress): the workers send
+the reports through a queue, and a thread in the server hands them to the
+callback given to SearchPool.run, on the event loop. They can also be
+cancelled (see Game.cancel) through a flag in shared memory, one per
+search that may be pending at once, and profiled with cProfile (see
+profiles.py).
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import analysis
+import profiles
+from main import TABLEBASE_PATH, Game
+
+WORKERS = int(os.environ.get("MORRIS_WORKERS", os.cpu_count() or 1))
+QUEUE_LIMIT = int(os.environ.get("MORRIS_QUEUE_LIMIT", 2 * WORKERS))
+
+
+class PoolBusy(Exception):
+    """Raised when every worker is busy and the queue is full"""
+
+
+class SearchPool:
+    """Runs the worker functions below in a lazily started process pool"""
+
+    def __init__(self, workers=WORKERS, queue_limit=QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.executor = None
+        # Searches running or waiting for a worker
+        self.pending = 0
+        # Progress reports from the workers, and the callbacks they go to by search id
+        self.reports = None
+        self.relay = None
+        self.listeners = {}
+        self.next_id = 0
+        # Cancellation flags shared with the workers, and the ones not in use
+        self.flags = None
+        self.free_flags = list(range(workers + queue_limit))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.reports.put(None)
+            self.relay.join()
+
+    def full(self):
+        """Whether run would raise PoolBusy"""
+        return self.pending >= self.workers + self.queue_limit
+
+    async def run(self, function, *args, progress=None, cancel=None, profile=False):
+        """
+        Run function(*args) in a worker process and return its result,
+        passing the search's progress reports to progress(depth, nodes,
+        best_move) if given. Setting cancel, an asyncio.Event, stops the
+        search early with the best move of its last completed depth. With
+        profile, the search runs under cProfile and (result, statistics)
+        is returned, as profiles.profiled gives them.
+        """
+        if self.full():
+            raise PoolBusy
+        loop = asyncio.get_running_loop()
+        if self.executor is None:
+            self.reports = multiprocessing.Queue()
+            self.flags = multiprocessing.RawArray('b', len(self.free_flags))
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                initargs=(TABLEBASE_PATH, self.reports, self.flags))
+            self.relay = threading.Thread(target=self._relay, args=(loop,), daemon=True)
+            self.relay.start()
+        search_id = None
+        if progress is not None:
+            search_id = self.next_id
+            self.next_id += 1
+            self.listeners[search_id] = progress
+        flag = watcher = None
+        if cancel is not None:
+            flag = self.free_flags.pop()
+            self.flags[flag] = 0
+            watcher = asyncio.create_task(self._watch(cancel, flag))
+        call = functools.partial(function, *args, search_id=search_id, flag=flag)
+        if profile:
+            call = functools.partial(profiles.profiled, call)
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self.pending -= 1
+            self.listeners.pop(search_id, None)
+            if watcher is not None:
+                watcher.cancel()
+                self.free_flags.append(flag)
+
+    async def _watch(self, cancel, flag):
+        await cancel.wait()
+        self.flags[flag] = 1
+
+    def _relay(self, loop):
+        # Runs in a thread: forward each report to the event loop, until shutdown sends None
+        while True:
+            report = self.reports.get()
+            if report is None:
+                break
+            loop.call_soon_threadsafe(self._deliver, *report)
+
+    def _deliver(self, search_id, report):
+        listener = self.listeners.get(search_id)
+        if listener is not None:
+            listener(*report)
+
+
+class SharedFlag:
+    """Cancellation token of a worker's search, set by the server in shared memory"""
+
+    def __init__(self, flags, index):
+        self.flags = flags
+        self.index = index
+
+    def is_set(self):
+        return self.flags[self.index] != 0
+
+
+# The game of the current worker process, reused by every request it serves,
+# the queue its progress reports go to and the cancellation flags
+_game = None
+_reports = None
+_flags = None
+
+
+def _init_worker(tablebase_path, reports, flags):
+    global _reports, _flags
+    _reports = reports
+    _flags = flags
+    if os.path.exists(tablebase_path):
+        Game.load_tablebase(tablebase_path)
+
+
+def _load(state, search_id, flag, fresh=False):
+    global _game
+    if _game is None:
+        _game = Game()
+    if fresh:
+        # Empties the transposition table, killer moves and history scores
+        _game.start()
+    _game.restore(state)
+    _game.history.clear()
+    _game.reset_stats()
+    _game.progress = None
+    if search_id is not None:
+        _game.progress = lambda *report: _reports.put((search_id, report))
+    _game.cancel = SharedFlag(_flags, flag) if flag is not None else None
+    return _game
+
+
+def computer_move(state, depth, time_ms, fresh=False, search_id=None, flag=None):
+    """
+    Game.computer_move on a snapshot, from an empty transposition table if
+    fresh: returns (depth, snapshot after, history entries added,
+    search_stats)
+    """
+    game = _load(state, search_id, flag, fresh)
+    depth = game.computer_move(depth, time_ms)
+    return depth, game.snapshot(), list(game.history), game.last_search
+
+
+def remove_best_opponent_piece(state, depth, time_ms, fresh=False, search_id=None, flag=None):
+    """Game.remove_best_opponent_piece on a snapshot, like computer_move"""
+    game = _load(state, search_id, flag, fresh)
+    depth = game.remove_best_opponent_piece(depth, time_ms)
+    return depth, game.snapshot(), list(game.history), game.last_search
+
+
+def minimax(state, depth, alpha, beta, maximizing_player, fresh=False, search_id=None, flag=None):
+    """Game.minimax on a snapshot, like computer_move: returns (score, best_move, search_stats)"""
+    game = _load(state, search_id, flag, fresh)
+    score, best_move = game.minimax(depth, alpha, beta, maximizing_player)
+    pv = game.principal_variation(maximizing_player, depth, best_move) if best_move else []
+    return score, best_move, game.search_stats(depth, pv)
+
+
+def analyze(positions, depth, search_id=None, flag=None):
+    """analysis.analyze_chunk in a worker"""
+    return analysis.analyze_chunk(positions, depth)